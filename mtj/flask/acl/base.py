@@ -1,6 +1,11 @@
 from __future__ import absolute_import
 
-import time
+import threading
+
+from .exc import InputTooLongError
+from .metrics import inc
+from .timing import timed
+from .tokens import MemoryTokenStore
 
 
 class BaseUser(object):
@@ -38,12 +43,47 @@ class BaseGroup(object):
 
 
 class BaseAcl(object):
+    """
+    Base ACL.
+
+    Logins, passwords and form submissions longer than the
+    ``max_login_length``, ``max_password_length`` and ``max_form_size``
+    are rejected before any password hashing is done; set to None for
+    no limit.  ``validate``, ``register`` and ``updatePassword`` raise
+    ``InputTooLongError`` for such input rather than returning False.
+    """
 
     def __init__(self, prefix='/acl', *a, **kw):
-        self._tbl_access_tokens = {}
+        token_store = kw.pop('token_store', None)
+        if token_store is None:
+            token_store = MemoryTokenStore()
+        self.token_store = token_store
+
+        self.max_login_length = kw.pop('max_login_length', 255)
+        self.max_password_length = kw.pop('max_password_length', 1024)
+        self.max_form_size = kw.pop('max_form_size', 65536)
+        self.rejected_inputs = 0
+        self._rejected_lock = threading.Lock()
 
         self.prefix = prefix
 
+    def checkInput(self, login=None, password=None, size=None):
+        """
+        Raise ``InputTooLongError`` if the login, password or the size
+        of a form exceeds its maximum.
+        """
+
+        checks = (
+            (login and len(login), self.max_login_length),
+            (password and len(password), self.max_password_length),
+            (size, self.max_form_size),
+        )
+        for length, limit in checks:
+            if length and limit is not None and length > limit:
+                with self._rejected_lock:
+                    self.rejected_inputs += 1
+                raise InputTooLongError
+
     def authenticate(self, login, password):
         if self.validate(login, password):
             return self.generateAccessToken(login)
@@ -55,29 +95,24 @@ class BaseAcl(object):
     def getUser(self, user):
         return anonymous
 
+    @timed('tokens')
     def generateAccessToken(self, login):
         """
         Store and return an access token.
         """
 
-        ts = time.time()
-        if login not in self._tbl_access_tokens:
-            self._tbl_access_tokens[login] = []
-
-        self._tbl_access_tokens[login].append(ts)
-
-        access_token = {
-            'login': login,
-            'ts': ts,
-        }
-
-        return access_token
+        return self.token_store.issue(login)
 
+    @timed('tokens')
     def validateAccessToken(self, access_token):
-        login = access_token.get('login')
-        ts = access_token.get('ts')
+        result = self.token_store.validate(access_token)
+        inc('mtj_acl_token_validations_total',
+            result='valid' if result else 'invalid')
+        return result
 
-        return ts in self._tbl_access_tokens.get(login, [])
+    @timed('tokens')
+    def revokeAccessToken(self, access_token):
+        self.token_store.revoke(access_token)
 
     def getUserFromAccessToken(self, access_token):
         if not self.validateAccessToken(access_token):
@@ -91,9 +126,31 @@ class BaseAcl(object):
     def getUserRoles(self, login):
         return []
 
-    def listUsers(self):
+    def loadPrincipal(self, login):
+        """
+        Return a tuple of the user, the names of the groups of the user
+        and the roles of the user for the login.  The group names and
+        roles may be None for backends that defer loading them.
+        """
+
+        return self.getUser(login), None, None
+
+    def listUsers(self, after=None, before=None, limit=None):
         return []
 
+    def searchUsers(self, query, limit=50):
+        """
+        Search for users where their login, name or email starts with
+        the query (case sensitive), ordered by login.
+        """
+
+        if not query:
+            return []
+
+        return [u for u in self.listUsers() if any(
+            (getattr(u, attr, None) or '').startswith(query)
+            for attr in ('login', 'name', 'email'))][:limit]
+
     def updatePassword(self, login, password):
         return False
 
@@ -141,8 +198,16 @@ class SetupAcl(BaseAcl):
             return [self.admin_group]
         return []
 
-    def listUsers(self):
-        return [self.admin_user, BaseUser(self.login)]
+    def listUsers(self, after=None, before=None, limit=None):
+        users = sorted([self.admin_user, BaseUser(self.login)],
+            key=lambda u: u.login)
+        if after is not None:
+            users = [u for u in users if u.login > after]
+        if before is not None:
+            users = [u for u in users if u.login < before]
+            if limit is not None:
+                users = users[-limit:]
+        return users[:limit]
 
     def getUserRoles(self, user):
         if user == self.admin_user:
@@ -0,0 +1,176 @@
+"""
+Benchmark helpers.
+
+Benchmarks are named callables that are timed over a number of calls,
+with the latencies summarized as percentiles.  Results are written as
+JSON and may be compared against a baseline from a previous run to
+catch regressions.
+"""
+
+from __future__ import absolute_import
+
+import json
+import math
+import platform
+import sys
+from collections import OrderedDict
+from timeit import default_timer
+
+format_version = 1
+
+
+def measure(f, repeat=100, warmup=5, timer=default_timer):
+    """
+    Call f warmup times, then repeat times, returning the durations of
+    the latter in seconds.
+    """
+
+    for i in range(warmup):
+        f()
+
+    samples = []
+    for i in range(repeat):
+        start = timer()
+        f()
+        samples.append(timer() - start)
+    return samples
+
+
+def percentile(samples, q):
+    """
+    Nearest rank percentile q of the sorted samples.
+    """
+
+    if not samples:
+        return None
+    index = int(math.ceil(q / 100.0 * len(samples))) - 1
+    return samples[min(max(index, 0), len(samples) - 1)]
+
+
+def summarize(samples):
+    samples = sorted(samples)
+    if not samples:
+        return {'count': 0}
+    return OrderedDict([
+        ('count', len(samples)),
+        ('min', samples[0]),
+        ('mean', sum(samples) / len(samples)),
+        ('p50', percentile(samples, 50)),
+        ('p90', percentile(samples, 90)),
+        ('p95', percentile(samples, 95)),
+        ('p99', percentile(samples, 99)),
+        ('max', samples[-1]),
+    ])
+
+
+def run(benchmarks, repeat=100, warmup=5, prefix=''):
+    """
+    Run the benchmarks, an iterable of (name, callable), returning an
+    ordered dict of their names (with the prefix) to their summaries.
+    """
+
+    results = OrderedDict()
+    for name, f in benchmarks:
+        results[prefix + name] = summarize(measure(f, repeat, warmup))
+    return results
+
+
+def compare(results, baseline, tolerance=0.25, key='p50'):
+    """
+    Return a list of (name, baseline value, value) for the results
+    where the key exceeds the one in the baseline by more than the
+    tolerance.  Results missing from the baseline are ignored.
+    """
+
+    regressions = []
+    for name, summary in results.items():
+        base = baseline.get(name)
+        if not base or base.get(key) is None or summary.get(key) is None:
+            continue
+        if summary[key] > base[key] * (1 + tolerance):
+            regressions.append((name, base[key], summary[key]))
+    return regressions
+
+
+def dump(results, stream, **meta):
+    document = OrderedDict([
+        ('version', format_version),
+        ('python', platform.python_version()),
+        ('platform', platform.platform()),
+    ])
+    document.update(sorted(meta.items()))
+    document['results'] = results
+    json.dump(document, stream, indent=2)
+    stream.write('\n')
+
+
+def load(stream):
+    """
+    Load the results from a stream written by ``dump``.
+    """
+
+    document = json.load(stream, object_pairs_hook=OrderedDict)
+    return document.get('results', {})
+
+
+def report(results, stream=sys.stderr):
+    """
+    Write the results as a table in milliseconds.
+    """
+
+    columns = ('p50', 'p90', 'p95', 'p99', 'max')
+    width = max([len(name) for name in results] + [4])
+    stream.write('%-*s %8s' % (width, 'name', 'count') +
+        ''.join(' %10s' % c for c in columns) + '\n')
+    for name, summary in results.items():
+        stream.write('%-*s %8d' % (width, name, summary['count']) +
+            ''.join(' %10.3f' % (summary.get(c, 0) * 1000)
+                for c in columns) + '\n')
+
+
+def add_arguments(parser, repeat=True):
+    """
+    Add the common arguments for running and comparing benchmarks to
+    an ``argparse`` parser, without the repeat and warmup arguments if
+    ``repeat`` is False.
+    """
+
+    if repeat:
+        parser.add_argument('--repeat', type=int, default=100)
+        parser.add_argument('--warmup', type=int, default=5)
+    parser.add_argument('--output', default=None,
+        help='write the JSON results to this file, defaults to stdout')
+    parser.add_argument('--baseline', default=None,
+        help='JSON results of a previous run to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+        help='fraction of the baseline p50 allowed before failing')
+    parser.add_argument('--quiet', action='store_true',
+        help='do not report the results and regressions to stderr')
+
+
+def finish(args, results, **meta):
+    """
+    Write and report the results as requested by the arguments from
+    ``add_arguments``, returning the exit status, which is 1 if there
+    are regressions against the baseline.
+    """
+
+    if args.output:
+        with open(args.output, 'w') as stream:
+            dump(results, stream, **meta)
+    else:
+        dump(results, sys.stdout, **meta)
+    if not args.quiet:
+        report(results)
+
+    if not args.baseline:
+        return 0
+
+    with open(args.baseline) as stream:
+        baseline = load(stream)
+    regressions = compare(results, baseline, args.tolerance)
+    if not args.quiet:
+        for name, before, after in regressions:
+            sys.stderr.write('regression: %s p50 %.3fms -> %.3fms\n' % (
+                name, before * 1000, after * 1000))
+    return 1 if regressions else 0
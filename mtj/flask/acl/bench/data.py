@@ -0,0 +1,117 @@
+from __future__ import absolute_import
+
+import bisect
+import random
+from collections import OrderedDict
+
+from mtj.flask.acl.sql import User, Group, UserGroup, GroupRole
+
+distributions = ('uniform', 'zipf')
+
+
+class Picker(object):
+    """
+    Picks distinct items at random, either uniformly or with a zipf
+    distribution where the item at rank i is picked with a weight of
+    1 / i ** exponent, such that a few items get most of the picks.
+    """
+
+    def __init__(self, items, rng, distribution='uniform', exponent=1.0):
+        if distribution not in distributions:
+            raise ValueError('unknown distribution %r' % distribution)
+
+        self.items = list(items)
+        self.rng = rng
+        self.distribution = distribution
+
+        self._cumulative = None
+        if distribution == 'zipf':
+            total = 0.0
+            self._cumulative = []
+            for i in range(len(self.items)):
+                total += 1.0 / (i + 1) ** exponent
+                self._cumulative.append(total)
+
+    def _one(self):
+        if self._cumulative is None:
+            return self.items[self.rng.randrange(len(self.items))]
+        value = self.rng.random() * self._cumulative[-1]
+        index = bisect.bisect_right(self._cumulative, value)
+        return self.items[min(index, len(self.items) - 1)]
+
+    def pick(self, k):
+        """
+        Return a list of k distinct items, or all of them if there are
+        no more than k.
+        """
+
+        if k >= len(self.items):
+            return list(self.items)
+        if self._cumulative is None:
+            return self.rng.sample(self.items, k)
+
+        results = OrderedDict()
+        while len(results) < k:
+            results[self._one()] = True
+        return list(results)
+
+
+def generate(acl, users=1000, groups=50, roles=10, groups_per_user=3,
+        roles_per_group=2, distribution='uniform', seed=0,
+        chunk_size=5000, password='password'):
+    """
+    Populate the database of the ``SqlAcl`` with generated users,
+    groups and roles, where each user is in up to ``groups_per_user``
+    groups and each group has up to ``roles_per_group`` roles, picked
+    using the distribution.  The same seed generates the same data.
+
+    All users share the hash of the password, as hashing a password per
+    user would dominate the time taken.  Returns a dict of the number of
+    rows added by type.
+    """
+
+    rng = random.Random(seed)
+    password_hash = acl.hasher.encrypt(password)
+
+    logins = ['user%07d' % i for i in range(users)]
+    group_names = ['group%05d' % i for i in range(groups)]
+    role_names = ['role%04d' % i for i in range(roles)]
+
+    session = acl.session()
+    counts = OrderedDict((key, 0) for key in (
+        'user', 'group', 'user_group', 'group_role'))
+
+    def insert(model, key, rows):
+        if rows:
+            session.execute(model.__table__.insert(), rows)
+            counts[key] += len(rows)
+
+    for i in range(0, users, chunk_size):
+        insert(User, 'user', [{
+            'login': login,
+            'password': password_hash,
+            'name': 'User %s' % login[4:],
+            'email': '%s@example.com' % login,
+        } for login in logins[i:i + chunk_size]])
+
+    insert(Group, 'group', [{
+        'name': name,
+        'description': 'Group %s' % name[5:],
+    } for name in group_names])
+
+    if role_names:
+        picker = Picker(role_names, rng, distribution)
+        insert(GroupRole, 'group_role', [{'group': name, 'role': role}
+            for name in group_names
+            for role in picker.pick(rng.randint(0, roles_per_group))])
+
+    if group_names:
+        picker = Picker(group_names, rng, distribution)
+        for i in range(0, users, chunk_size):
+            insert(UserGroup, 'user_group', [{'user': login, 'group': name}
+                for login in logins[i:i + chunk_size]
+                for name in picker.pick(rng.randint(0, groups_per_user))])
+
+    session.commit()
+    session.close()
+    return dict(counts)
@@ -0,0 +1,154 @@
+from __future__ import absolute_import
+
+import os
+import tempfile
+from collections import OrderedDict
+
+from flask import Flask, g
+
+from mtj.flask.acl import bench
+from mtj.flask.acl import csrf
+from mtj.flask.acl import user
+from mtj.flask.acl.flask import verifyUserRole
+from mtj.flask.acl.hashing import PasswordHasher
+from mtj.flask.acl.hooks import csrf_protect
+from mtj.flask.acl.principal import AclIdentity
+from mtj.flask.acl.sql import SqlAcl
+
+from flask.ext.principal import RoleNeed
+from flask.ext.principal import identity_loaded
+
+login = 'admin'
+password = 'password'
+
+
+def make_app(src='sqlite://', rounds=None):
+    """
+    Return an app with a ``SqlAcl`` on src set up with an admin user,
+    the ``acl_front`` blueprint and the CSRF protection hook.
+    """
+
+    hasher = PasswordHasher(rounds=rounds)
+    acl = SqlAcl(src, hasher=hasher,
+        setup_login=login, setup_password=password)
+
+    app = Flask('mtj.flask.acl')
+    app.config['SECRET_KEY'] = 'bench_secret_key'
+    app.config['MTJ_CSRF'] = csrf.Authenticator()
+    acl(app, permission_denied_handler=None)
+    app.before_request(csrf_protect)
+    app.register_blueprint(user.acl_front, url_prefix='/acl')
+    return app
+
+
+def make_benchmarks(app):
+    """
+    Return a list of (name, callable) for the hot paths of the app
+    from ``make_app``.
+    """
+
+    acl = app.config['MTJ_ACL']
+    authenticator = app.config['MTJ_CSRF']
+    access_token = acl.generateAccessToken(login)
+    admin = acl.getUser(login)
+    csrf_token = authenticator.getSecretFor(login)
+
+    client = app.test_client()
+    client.post('/acl/login', data={'login': login, 'password': password})
+    anonymous_client = app.test_client()
+
+    def request_context():
+        # the overhead shared by the benchmarks that need a request.
+        with app.test_request_context('/'):
+            pass
+
+    def authenticate():
+        acl.authenticate(login, password)
+
+    def validate_access_token():
+        acl.validateAccessToken(access_token)
+
+    def identity_load():
+        with app.test_request_context('/'):
+            identity = AclIdentity(access_token)
+            identity_loaded.send(app, identity=identity)
+            RoleNeed('admin') in identity.provides
+
+    def verify_user_role():
+        with app.test_request_context('/'):
+            g.mtj_user = admin
+            verifyUserRole('admin')
+
+    def csrf_check():
+        with app.test_request_context('/', method='POST',
+                data={csrf.csrf_key: csrf_token}):
+            g.mtj_user = admin
+            csrf_protect()
+
+    def page(c, path):
+        def get():
+            c.get(path)
+        return get
+
+    return [
+        ('request_context', request_context),
+        ('authenticate', authenticate),
+        ('validateAccessToken', validate_access_token),
+        ('identity_loaded', identity_load),
+        ('verifyUserRole', verify_user_role),
+        ('csrf_protect', csrf_check),
+        ('page_login', page(anonymous_client, '/acl/login')),
+        ('page_current', page(client, '/acl/current')),
+        ('page_user_list', page(client, '/acl/list')),
+        ('page_group_list', page(client, '/acl/group/list')),
+        ('page_user_edit', page(client, '/acl/edit/admin')),
+    ]
+
+
+def run(repeat=100, warmup=5, rounds=None, databases=('memory', 'file')):
+    """
+    Run the benchmarks against each of the databases, which is either
+    an in-memory or a temporary file-backed SQLite database, returning
+    the results with names prefixed by the database.
+    """
+
+    results = OrderedDict()
+    for database in databases:
+        path = None
+        src = 'sqlite://'
+        if database == 'file':
+            fd, path = tempfile.mkstemp(suffix='.db')
+            os.close(fd)
+            src = 'sqlite:///' + path
+        try:
+            app = make_app(src, rounds)
+            results.update(bench.run(make_benchmarks(app), repeat, warmup,
+                prefix=database + ':'))
+            app.config['MTJ_ACL']._conn.dispose()
+        finally:
+            if path:
+                os.unlink(path)
+    return results
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description='Benchmark the authentication and authorization '
+            'hot paths.')
+    bench.add_arguments(parser)
+    parser.add_argument('--rounds', type=int, default=None,
+        help='password hashing rounds, defaults to the passlib default')
+    parser.add_argument('--database', action='append',
+        choices=('memory', 'file'),
+        help='database to run against, defaults to both')
+    args = parser.parse_args(argv)
+
+    databases = args.database or ('memory', 'file')
+    results = run(args.repeat, args.warmup, args.rounds, databases)
+    return bench.finish(args, results, rounds=args.rounds)
+
+if __name__ == '__main__':
+    import sys
+    sys.exit(main())
@@ -0,0 +1,222 @@
+from __future__ import absolute_import
+
+import os
+import random
+import sys
+import tempfile
+import threading
+from collections import OrderedDict
+from timeit import default_timer
+
+from flask import Flask
+
+from mtj.flask.acl import bench
+from mtj.flask.acl import csrf
+from mtj.flask.acl import user
+from mtj.flask.acl.flask import permission_from_roles
+from mtj.flask.acl.flask import verifyUserRole
+from mtj.flask.acl.hashing import PasswordHasher
+from mtj.flask.acl.hooks import csrf_protect
+from mtj.flask.acl.sql import SqlAcl
+
+password = 'password'
+
+# action -> expected status code.
+actions = OrderedDict([
+    ('login', 302),
+    ('page', 200),
+    ('post', 200),
+    ('logout', 302),
+])
+
+default_mix = 'login=1,page=10,post=3,logout=1'
+
+
+def parse_mix(value):
+    """
+    Parse a mix such as ``login=1,page=10`` into an ordered dict of the
+    actions to their weights.
+    """
+
+    mix = OrderedDict()
+    for item in value.split(','):
+        name, _, weight = item.partition('=')
+        name = name.strip()
+        if name not in actions:
+            raise ValueError('unknown action %r' % name)
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def make_logins(users):
+    return ['user%04d' % i for i in range(users)]
+
+
+def make_app(src, logins, rounds=1000):
+    """
+    Return a sample app with a ``SqlAcl`` on src, the ``acl_front``
+    blueprint, the CSRF protection hook and the views of the actions,
+    with the logins registered as users with the ``staff`` role.
+    """
+
+    # registers the role such that it can be assigned.
+    permission_from_roles('staff')
+    acl = SqlAcl(src, hasher=PasswordHasher(rounds=rounds),
+        setup_login='admin', setup_password=password)
+    acl.registerMany([(login, password) for login in logins])
+    acl.addGroup('staff', 'Staff')
+    acl.setGroupRoles(acl.getGroup('staff'), ['staff'])
+    acl.setUserGroupsMany(dict((login, ['staff']) for login in logins))
+
+    app = Flask('mtj.flask.acl')
+    app.config['SECRET_KEY'] = 'load_secret_key'
+    app.config['MTJ_CSRF'] = csrf.Authenticator()
+    acl(app)
+    app.before_request(csrf_protect)
+    app.register_blueprint(user.acl_front, url_prefix='/acl')
+
+    @app.route('/page')
+    def page():
+        verifyUserRole('staff')
+        return 'page'
+
+    @app.route('/post', methods=['POST'])
+    def post():
+        verifyUserRole('staff')
+        return 'post'
+
+    return app
+
+
+class Worker(threading.Thread):
+    """
+    Replays a random mix of the actions against the app through its own
+    test client, keeping its samples locally until joined.
+    """
+
+    def __init__(self, app, login, mix, requests, seed=0):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.app = app
+        self.login = login
+        self.mix = mix
+        self.requests = requests
+        self.rng = random.Random(seed)
+
+        self.samples = dict((action, []) for action in actions)
+        self.errors = dict((action, 0) for action in actions)
+
+    def choose(self):
+        value = self.rng.random() * sum(self.mix.values())
+        for action, weight in self.mix.items():
+            value -= weight
+            if value < 0:
+                return action
+        return action
+
+    def run(self):
+        client = self.app.test_client()
+        token = self.app.config['MTJ_CSRF'].getSecretFor(self.login)
+        logged_in = False
+
+        for i in range(self.requests):
+            action = self.choose()
+            if not logged_in:
+                action = 'login'
+            elif action == 'login':
+                # a fresh session, as the login form is protected from
+                # cross site requests for users already logged in.
+                client = self.app.test_client()
+
+            start = default_timer()
+            if action == 'login':
+                rv = client.post('/acl/login',
+                    data={'login': self.login, 'password': password})
+                logged_in = True
+            elif action == 'page':
+                rv = client.get('/page')
+            elif action == 'post':
+                rv = client.post('/post', data={csrf.csrf_key: token})
+            else:
+                rv = client.get('/acl/logout')
+                logged_in = False
+            self.samples[action].append(default_timer() - start)
+
+            if rv.status_code != actions[action]:
+                self.errors[action] += 1
+
+
+def run(app, logins, threads=4, requests=1000, mix=None, seed=0):
+    """
+    Run the requests split across the threads, each logging in with one
+    of the logins, returning the results by action, the number of errors
+    by action and the elapsed time.
+    """
+
+    if mix is None:
+        mix = parse_mix(default_mix)
+    workers = [Worker(app, logins[i % len(logins)], mix,
+            requests // threads + (i < requests % threads), seed + i)
+        for i in range(threads)]
+
+    start = default_timer()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = default_timer() - start
+
+    results = OrderedDict()
+    errors = OrderedDict()
+    for action in actions:
+        samples = sum((w.samples[action] for w in workers), [])
+        if samples:
+            results[action] = bench.summarize(samples)
+            errors[action] = sum(w.errors[action] for w in workers)
+    return results, errors, elapsed
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description='Drive a sample app with the ACL through WSGI from '
+            'concurrent threads and report the latency per action.')
+    bench.add_arguments(parser, repeat=False)
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--requests', type=int, default=1000,
+        help='total number of requests across the threads')
+    parser.add_argument('--mix', type=parse_mix, default=default_mix,
+        help='weights of the actions, defaults to %s' % default_mix)
+    parser.add_argument('--users', type=int, default=10)
+    parser.add_argument('--rounds', type=int, default=1000,
+        help='password hashing rounds, raise for realistic logins')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    fd, path = tempfile.mkstemp(suffix='.db')
+    os.close(fd)
+    try:
+        logins = make_logins(args.users)
+        app = make_app('sqlite:///' + path, logins, args.rounds)
+        results, errors, elapsed = run(app, logins, args.threads,
+            args.requests, args.mix, args.seed)
+        app.config['MTJ_ACL']._conn.dispose()
+    finally:
+        os.unlink(path)
+
+    throughput = OrderedDict((action, summary['count'] / elapsed)
+        for action, summary in results.items())
+    throughput['total'] = sum(s['count'] for s in results.values()) / elapsed
+    if not args.quiet:
+        sys.stderr.write('%d threads, %.2fs, %.1f requests/s\n' % (
+            args.threads, elapsed, throughput['total']))
+        for action, count in errors.items():
+            if count:
+                sys.stderr.write('errors: %s %d\n' % (action, count))
+    status = bench.finish(args, results, threads=args.threads,
+        elapsed=elapsed, throughput=throughput, errors=errors)
+    return status or (1 if any(errors.values()) else 0)
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,80 @@
+from __future__ import absolute_import
+
+import sys
+from collections import OrderedDict
+
+from mtj.flask.acl import bench
+from mtj.flask.acl.hashing import PasswordHasher
+from mtj.flask.acl.sql import SqlAcl
+
+
+def make_benchmarks(acl):
+    """
+    Return the (name, callable) validating a wrong password for a known
+    and an unknown user against the acl, which must have ``user``.
+    """
+
+    def known():
+        acl.validate('user', 'wrongpassword')
+
+    def unknown():
+        acl.validate('nouser', 'wrongpassword')
+
+    return [
+        ('known', known),
+        ('unknown', unknown),
+    ]
+
+
+def run(repeat=20, warmup=2, rounds=20000):
+    """
+    Time the validation of known and unknown users, returning the
+    results by name.
+    """
+
+    acl = SqlAcl(hasher=PasswordHasher(rounds=rounds))
+    acl.register('user', 'password')
+    return bench.run(make_benchmarks(acl), repeat, warmup)
+
+
+def differences(results, tolerance=0.25, key='p50'):
+    """
+    Return the list of (name, other value, value) where the validation
+    of a known or unknown user is slower than the other beyond the
+    tolerance, i.e. where timing leaks whether a user exists.
+    """
+
+    known = OrderedDict([('validate', results['known'])])
+    unknown = OrderedDict([('validate', results['unknown'])])
+    return [('known',) + r[1:]
+            for r in bench.compare(known, unknown, tolerance, key)] + [
+        ('unknown',) + r[1:]
+            for r in bench.compare(unknown, known, tolerance, key)]
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description='Compare the validation time of known and unknown '
+            'users.')
+    bench.add_arguments(parser)
+    parser.add_argument('--rounds', type=int, default=20000,
+        help='password hashing rounds')
+    parser.add_argument('--max-difference', type=float, default=0.25,
+        help='fail if known and unknown users differ by this fraction')
+    parser.set_defaults(repeat=20, warmup=2)
+    args = parser.parse_args(argv)
+
+    results = run(args.repeat, args.warmup, args.rounds)
+    status = bench.finish(args, results, rounds=args.rounds)
+
+    for name, other, value in differences(results, args.max_difference):
+        if not args.quiet:
+            sys.stderr.write('parity: %s user p50 %.3fms vs %.3fms\n' % (
+                name, value * 1000, other * 1000))
+        status = 1
+    return status
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,164 @@
+from __future__ import absolute_import
+
+import math
+import os
+import random
+import sys
+import tempfile
+from collections import OrderedDict
+
+from flask import Flask
+
+from mtj.flask.acl import bench
+from mtj.flask.acl import user
+from mtj.flask.acl.bench.data import distributions
+from mtj.flask.acl.bench.data import generate
+from mtj.flask.acl.hashing import PasswordHasher
+from mtj.flask.acl.sql import SqlAcl
+
+
+def dataset_size(users):
+    """
+    Return the (users, groups, roles) for a number of users, scaled as
+    20 users per group and 200 users per role, up to 500 roles.
+    """
+
+    return users, max(1, users // 20), min(500, max(1, users // 200))
+
+
+def make_benchmarks(app, users, groups, seed=0):
+    acl = app.config['MTJ_ACL']
+    rng = random.Random(seed)
+
+    def login():
+        return 'user%07d' % rng.randrange(users)
+
+    def group_names():
+        return ['group%05d' % i for i in rng.sample(range(groups),
+            min(3, groups))]
+
+    client = app.test_client()
+    client.post('/acl/login', data={'login': 'admin', 'password': 'password'})
+
+    def get_user_roles():
+        acl.getUserRoles(acl.getUser(login()))
+
+    def get_user_groups():
+        acl.getUserGroups(acl.getUser(login()))
+
+    def set_user_groups():
+        acl.setUserGroups(acl.getUser(login()), group_names())
+
+    def list_users():
+        acl.listUsers(after=login(), limit=50)
+
+    def page(path):
+        def get():
+            client.get(path % {'login': login()})
+        return get
+
+    return [
+        ('getUserRoles', get_user_roles),
+        ('getUserGroups', get_user_groups),
+        ('setUserGroups', set_user_groups),
+        ('listUsers', list_users),
+        ('page_user_list', page('/acl/list')),
+        ('page_user_search', page('/acl/list?q=%(login)s')),
+        ('page_group_list', page('/acl/group/list')),
+        ('page_group_user', page('/acl/group/user/%(login)s')),
+        ('page_user_edit', page('/acl/edit/%(login)s')),
+    ]
+
+
+def exponents(results, sizes):
+    """
+    Return the scaling exponent of each benchmark between consecutive
+    sizes, i.e. k where the p50 latency grows as size ** k; about 0
+    for constant time, 1 for linear.
+    """
+
+    names = OrderedDict()
+    for key in results:
+        names[key.split(':', 1)[1]] = True
+
+    found = OrderedDict()
+    for name in names:
+        steps = []
+        for small, large in zip(sizes, sizes[1:]):
+            before = results.get('users=%d:%s' % (small, name))
+            after = results.get('users=%d:%s' % (large, name))
+            if not before or not after or not before['p50']:
+                continue
+            steps.append(math.log(after['p50'] / before['p50']) /
+                math.log(float(large) / small))
+        found[name] = steps
+    return found
+
+
+def run(sizes=(1000, 10000), repeat=50, warmup=5, distribution='uniform',
+        seed=0, rounds=1000):
+    """
+    Generate a dataset for each size in a temporary file-backed SQLite
+    database and run the benchmarks against it, returning the results
+    with names prefixed by the number of users.
+    """
+
+    results = OrderedDict()
+    for size in sizes:
+        users, groups, roles = dataset_size(size)
+        fd, path = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+        try:
+            acl = SqlAcl('sqlite:///' + path,
+                hasher=PasswordHasher(rounds=rounds),
+                setup_login='admin', setup_password='password')
+            generate(acl, users, groups, roles, distribution=distribution,
+                seed=seed)
+
+            app = Flask('mtj.flask.acl')
+            app.config['SECRET_KEY'] = 'bench_secret_key'
+            acl(app, permission_denied_handler=None)
+            app.register_blueprint(user.acl_front, url_prefix='/acl')
+
+            results.update(bench.run(
+                make_benchmarks(app, users, groups, seed), repeat, warmup,
+                prefix='users=%d:' % size))
+            acl._conn.dispose()
+        finally:
+            os.unlink(path)
+    return results
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description='Benchmark the ACL against growing datasets.')
+    bench.add_arguments(parser)
+    parser.add_argument('--size', type=int, action='append',
+        help='number of users of a dataset, defaults to 1000 and 10000')
+    parser.add_argument('--distribution', default='uniform',
+        choices=distributions,
+        help='distribution of group memberships and roles')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--max-exponent', type=float, default=0.5,
+        help='fail if latency grows faster than size to this power')
+    args = parser.parse_args(argv)
+
+    sizes = sorted(args.size or (1000, 10000))
+    results = run(sizes, args.repeat, args.warmup, args.distribution,
+        args.seed)
+    found = exponents(results, sizes)
+    status = bench.finish(args, results, sizes=sizes, exponents=found,
+        distribution=args.distribution, seed=args.seed)
+
+    for name, steps in found.items():
+        if any(k > args.max_exponent for k in steps):
+            if not args.quiet:
+                sys.stderr.write('scaling: %s exponents %s\n' % (
+                    name, ', '.join('%.2f' % k for k in steps)))
+            status = 1
+    return status
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,82 @@
+from __future__ import absolute_import
+
+import threading
+import time
+from collections import OrderedDict
+
+_marker = object()
+
+
+class LRUCache(object):
+    """
+    Size bounded least recently used cache, with entries expiring
+    ``ttl`` seconds after being set (never, if None).
+
+    Safe for use from multiple threads.  Keeps track of the number of
+    hits and misses for reporting.
+    """
+
+    def __init__(self, maxsize=1024, ttl=60, timer=time.time):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.timer = timer
+
+        self.hits = 0
+        self.misses = 0
+
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return self.get(key, _marker, count=False) is not _marker
+
+    def get(self, key, default=None, count=True):
+        with self._lock:
+            try:
+                expires, value = self._data.pop(key)
+            except KeyError:
+                if count:
+                    self.misses += 1
+                return default
+
+            if expires is not None and expires <= self.timer():
+                if count:
+                    self.misses += 1
+                return default
+
+            # reinsert to mark this as the most recently used.
+            self._data[key] = (expires, value)
+            if count:
+                self.hits += 1
+            return value
+
+    def set(self, key, value):
+        expires = None
+        if self.ttl is not None:
+            expires = self.timer() + self.ttl
+
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = (expires, value)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def discard(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'size': len(self._data),
+            'maxsize': self.maxsize,
+        }
@@ -1,10 +1,13 @@
 import random
 import hmac
+import time
 from hashlib import sha1 as sha
 
 from mtj.flask.acl import flask
+from mtj.flask.acl.cache import LRUCache
 
 csrf_key = '_authenticator'
+csrf_header = 'X-CSRF-Token'
 
 
 def randstr(b=128, r=None):
@@ -17,27 +20,126 @@ def randstr(b=128, r=None):
     return (('%%%ds' % (b / 4)) % hex(r(b))[2:]).replace(' ', '0')
 
 
+def compare(token, secret):
+    """
+    Constant time comparison of a submitted token against the secret.
+    """
+
+    if not isinstance(token, basestring):
+        return False
+    try:
+        token = str(token)
+    except UnicodeError:
+        return False
+    return hmac.compare_digest(token, secret)
+
+
 class Authenticator(object):
     """
     CSRF protection authenticator
+
+    The derived user secrets are kept in the ``cache`` (an ``LRUCache``
+    by default) keyed by the user, the secret and the time window.
+
+    If ``window`` is set, the user secrets rotate every ``window``
+    seconds, with the secrets of both the current and the previous
+    window being accepted.
     """
 
-    def __init__(self, secret=None):
+    def __init__(self, secret=None, cache=None, window=None,
+            timer=time.time):
         if secret is None:
             secret = randstr()
+        if cache is None:
+            cache = LRUCache(maxsize=1024)
 
         self.secret = secret
+        self.cache = cache
+        self.window = window
+        self.timer = timer
+
+    def currentWindow(self):
+        if self.window is None:
+            return None
+        return int(self.timer() // self.window)
 
-    def getSecretFor(self, username=None):
+    def getSecretFor(self, username=None, previous=False):
         """
-        Generate user specific user secret.
+        Generate user specific user secret, for the previous window if
+        ``previous`` is set.
         """
 
         if username is None:
             username = flask.getCurrentUser().login
 
-        return hmac.new(self.secret, username, sha).hexdigest()
+        index = self.currentWindow()
+        if index is not None and previous:
+            index -= 1
+
+        key = (username, self.secret, index)
+        result = self.cache.get(key)
+        if result is None:
+            msg = username
+            if index is not None:
+                msg = '%s\0%d' % (username, index)
+            result = hmac.new(self.secret, msg, sha).hexdigest()
+            self.cache.set(key, result)
+        return result
+
+    def verifyPrevious(self, token, username=None):
+        """
+        Verify the token against the secret of the previous window.
+        """
+
+        if self.window is None:
+            return False
+        return compare(token, self.getSecretFor(username, previous=True))
+
+    def verify(self, token, username=None):
+        return (compare(token, self.getSecretFor(username)) or
+            self.verifyPrevious(token, username))
 
     def render(self, username=None):
-        return '<input type="hidden" name="%s" value="%s" />' % (
-            csrf_key, self.getSecretFor(username))
+        return render_input(self.getSecretFor(username))
+
+    def lazyInput(self, username=None):
+        """
+        Return a ``LazyInput`` for the user, for use as ``g.csrf_input``.
+        """
+
+        if username is None:
+            username = flask.getCurrentUser().login
+        return LazyInput(self, username)
+
+
+def render_input(secret):
+    return '<input type="hidden" name="%s" value="%s" />' % (
+        csrf_key, secret)
+
+
+class LazyInput(object):
+    """
+    The hidden input for the token of a user.  The user secret is
+    derived at most once, and only when rendered or verified against.
+    """
+
+    def __init__(self, authenticator, username):
+        self.authenticator = authenticator
+        self.username = username
+        self._secret = None
+
+    @property
+    def secret(self):
+        if self._secret is None:
+            self._secret = self.authenticator.getSecretFor(self.username)
+        return self._secret
+
+    def verify(self, token):
+        return (compare(token, self.secret) or
+            self.authenticator.verifyPrevious(token, self.username))
+
+    def __html__(self):
+        return render_input(self.secret)
+
+    def __str__(self):
+        return render_input(self.secret)
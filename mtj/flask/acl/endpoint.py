@@ -8,9 +8,32 @@ from flask.ext.principal import identity_changed
 
 from mtj.flask.acl.base import anonymous
 from mtj.flask.acl.exc import SiteAclMissingError
+from mtj.flask.acl.exc import HashTimeoutError
+from mtj.flask.acl.exc import InputTooLongError
+from mtj.flask.acl import metrics
+from mtj.flask.acl.csrf import compare
 from mtj.flask.acl.principal import AclIdentity, AclAnonymousIdentity
 from mtj.flask.acl.flask import *
 
+def check_form_size():
+    """
+    Reject submissions larger than the maximum form size of the ACL
+    before the form is parsed, and those of unknown length as their
+    size cannot be checked up front.
+    """
+
+    acl_back = current_app.config.get('MTJ_ACL')
+    if not acl_back or request.method != 'POST':
+        return
+    if request.content_length is None and (
+            request.headers.get('Transfer-Encoding') or
+            request.environ.get('wsgi.input_terminated')):
+        abort(411)
+    try:
+        acl_back.checkInput(size=request.content_length)
+    except InputTooLongError:
+        abort(413)
+
 def login():
     acl_back = current_app.config.get('MTJ_ACL')
     if not acl_back:
@@ -23,7 +46,29 @@ def login():
     error = None
     login = request.form.get('login')
     password = request.form.get('password')
-    access_token = acl_back.authenticate(login, password)
+    address = request.remote_addr
+    throttle = current_app.config.get('MTJ_THROTTLE')
+
+    try:
+        acl_back.checkInput(login, password)
+    except InputTooLongError:
+        access_token = None
+        error = 'Login or password too long.'
+        outcome = 'too_long'
+    else:
+        if throttle and throttle.check(login, address):
+            # rejected before any password hashing is done.
+            access_token = None
+            error = 'Too many failed attempts, please try again later.'
+            outcome = 'throttled'
+        else:
+            access_token, error = _authenticate(
+                acl_back, throttle, login, password, address)
+            outcome = 'busy' if error else 'failure'
+
+    if access_token:
+        outcome = 'success'
+    metrics.inc('mtj_acl_login_total', outcome=outcome)
 
     if access_token:
         flash('Welcome %s' % access_token['login'])
@@ -31,15 +76,31 @@ def login():
             identity=AclIdentity(access_token))
         script_root = getattr(request, 'script_root', '')
         return redirect(script_root + request.form.get('next', ''))
-    else:
+    elif error is None:
         error = 'Invalid credentials'
 
     result = render_template('login.jinja', error_msg=error,
         next=request.form.get('next'))
     return result
 
+def _authenticate(acl_back, throttle, login, password, address):
+    try:
+        access_token = acl_back.authenticate(login, password)
+    except HashTimeoutError:
+        return None, 'Server is busy, please try again later.'
+
+    if throttle and access_token:
+        throttle.success(login, address)
+    elif throttle:
+        throttle.failure(login, address)
+    return access_token, None
+
 def logout():
     if getCurrentUser() not in (None, anonymous):
+        acl_back = current_app.config.get('MTJ_ACL')
+        access_token = getattr(g.identity, 'access_token', None)
+        if acl_back and access_token:
+            acl_back.revokeAccessToken(access_token)
         identity_changed.send(current_app._get_current_object(),
             identity=AclAnonymousIdentity())
         # cripes bad way to display a message while ensuring the nav
@@ -54,6 +115,35 @@ def current():
     return result
 
 
+def paginate(list_items, key):
+    """
+    Return a page of items using the keyset pagination arguments of the
+    request, along with the keys for the previous and next pages.
+    """
+
+    page_size = current_app.config.get('MTJ_ACL_PAGE_SIZE', 50)
+    after = request.args.get('after') or None
+    before = request.args.get('before') or None
+    prev_key = next_key = None
+
+    if before is not None:
+        items = list_items(before=before, limit=page_size + 1)
+        has_prev = len(items) > page_size
+        items = items[-page_size:]
+        if items:
+            prev_key = key(items[0]) if has_prev else None
+            next_key = key(items[-1])
+    else:
+        items = list_items(after=after, limit=page_size + 1)
+        has_next = len(items) > page_size
+        items = items[:page_size]
+        if items:
+            prev_key = key(items[0]) if after is not None else None
+            next_key = key(items[-1]) if has_next else None
+
+    return items, prev_key, next_key
+
+
 manager_or_admin = permission_from_roles('manager', 'admin')
 admin = permission_from_roles('admin')
 change_password = permission_from_roles('admin', 'self_passwd')
@@ -61,8 +151,16 @@ change_password = permission_from_roles('admin', 'self_passwd')
 @manager_or_admin.require()
 def user_list():
     acl_back = current_app.config.get('MTJ_ACL')
-    users = acl_back.listUsers()
-    return render_template('user_list.jinja', users=users)
+    query = request.args.get('q')
+    if query:
+        users = acl_back.searchUsers(query,
+            limit=current_app.config.get('MTJ_ACL_PAGE_SIZE', 50))
+        prev_key = next_key = None
+    else:
+        users, prev_key, next_key = paginate(
+            acl_back.listUsers, lambda u: u.login)
+    return render_template('user_list.jinja', users=users, query=query,
+        prev_key=prev_key, next_key=next_key)
 
 @manager_or_admin.require()
 def user_add():
@@ -73,11 +171,17 @@ def user_add():
         password = request.form.get('password')
         name = request.form.get('name')
         email = request.form.get('email')
-        result = acl_back.register(login, password, name, email)
-        if result:
-            flash('User created')
-            return redirect(url_for('.user_edit', user_login=login))
-        flash('Failed to create user %s as it already exists.' % login)
+        try:
+            result = acl_back.register(login, password, name, email)
+        except HashTimeoutError:
+            flash('Server is busy, please try again later.')
+        except InputTooLongError:
+            flash('Login or password too long.')
+        else:
+            if result:
+                flash('User created')
+                return redirect(url_for('.user_edit', user_login=login))
+            flash('Failed to create user %s as it already exists.' % login)
 
     return render_template('user_add.jinja')
 
@@ -101,35 +205,47 @@ def user_edit(user_login):
 
 def change_password_form(user, admin_mode=False):
     acl_back = current_app.config.get('MTJ_ACL')
-    result = error_msg = None
+    error_msg = None
 
     if request.method == 'POST':
-        old_password = request.form.get('old_password')
-        password = request.form.get('password')
-        confirm_password = request.form.get('confirm_password')
-
-        # verification is done all the way through, but in reverse order
-        if not (password and len(password) > 5):
-            error_msg = 'New password too short.'
-        if not password == confirm_password:
-            error_msg = 'Password and confirmation password mismatched.'
-        if not admin_mode:
-            if not acl_back.validate(user.login, old_password):
-                error_msg = 'Old password incorrect.'
-        if not admin_mode:
-            if not (old_password or password or confirm_password):
-                error_msg = 'Please fill out all the required fields.'
-
-        if not error_msg:
-            result = acl_back.updatePassword(user.login, password)
-            if result:
-                flash('Password updated')
-            else:
-                error_msg = 'Error updating password.'
+        try:
+            error_msg = _change_password(acl_back, user, admin_mode)
+        except HashTimeoutError:
+            error_msg = 'Server is busy, please try again later.'
+        except InputTooLongError:
+            error_msg = 'Password too long.'
 
     return render_template('user_passwd.jinja', user=user,
         admin_mode=admin_mode, error_msg=error_msg)
 
+def _change_password(acl_back, user, admin_mode):
+    error_msg = None
+
+    old_password = request.form.get('old_password')
+    password = request.form.get('password')
+    confirm_password = request.form.get('confirm_password')
+
+    # verification is done all the way through, but in reverse order
+    if not (password and len(password) > 5):
+        error_msg = 'New password too short.'
+    if not password == confirm_password:
+        error_msg = 'Password and confirmation password mismatched.'
+    if not admin_mode:
+        if not acl_back.validate(user.login, old_password):
+            error_msg = 'Old password incorrect.'
+    if not admin_mode:
+        if not (old_password or password or confirm_password):
+            error_msg = 'Please fill out all the required fields.'
+
+    if not error_msg:
+        result = acl_back.updatePassword(user.login, password)
+        if result:
+            flash('Password updated')
+        else:
+            error_msg = 'Error updating password.'
+
+    return error_msg
+
 @change_password.require()
 def passwd():
     user = getCurrentUser()
@@ -149,8 +265,10 @@ def passwd_admin(user_login):
 @manager_or_admin.require()
 def group_list():
     acl_back = current_app.config.get('MTJ_ACL')
-    groups = acl_back.listGroups()
-    return render_template('group_list.jinja', groups=groups)
+    groups, prev_key, next_key = paginate(
+        acl_back.listGroups, lambda g: g.name)
+    return render_template('group_list.jinja', groups=groups,
+        prev_key=prev_key, next_key=next_key)
 
 @manager_or_admin.require()
 def group_user(user_login):
@@ -213,3 +331,17 @@ def group_edit(group_name):
 
     return render_template('group_edit.jinja',
         group=group, roles=roles, group_roles=group_roles)
+
+def check_metrics_access():
+    """
+    Allow requests bearing the ``MTJ_METRICS_TOKEN`` (if set) as an
+    ``Authorization: Bearer`` header, otherwise require the admin role.
+    """
+
+    token = current_app.config.get('MTJ_METRICS_TOKEN')
+    header = request.headers.get('Authorization', '')
+    if token and header.startswith('Bearer ') and compare(
+            header[len('Bearer '):], str(token)):
+        return
+    with admin.require():
+        pass
@@ -7,3 +7,13 @@ class SiteAclMissingError(AclError):
     """
     Site ACL is missing.
     """
+
+class HashTimeoutError(AclError):
+    """
+    Password hashing could not be queued in time.
+    """
+
+class InputTooLongError(AclError):
+    """
+    Login, password or form exceeds the configured maximum length.
+    """
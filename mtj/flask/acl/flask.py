@@ -1,9 +1,13 @@
 from __future__ import absolute_import
 
+from timeit import default_timer
+
 from flask import abort, current_app, session, request, g
 from flask.ext.principal import Permission, RoleNeed
 
 from .base import anonymous
+from .metrics import observe
+from .timing import timed
 
 # Flask helpers.
 
@@ -13,17 +17,40 @@ _blueprint_roles = {}
 def getCurrentUser():
     return g.get('mtj_user', anonymous)
 
-def getCurrentUserGroupNames():
+def getCurrentUserCache():
+    """
+    Return the per-request cache for the current user, which is reset
+    whenever the current user changes.
+    """
+
     user = getCurrentUser()
-    acl_back = current_app.config.get('MTJ_ACL')
-    return [gp.name for gp in acl_back.getUserGroups(user)]
+    cache = g.get('mtj_user_cache')
+    if cache is None or cache[0] is not user:
+        cache = g.mtj_user_cache = (user, {})
+    return cache[1]
 
+@timed('helpers')
+def getCurrentUserGroupNames():
+    cache = getCurrentUserCache()
+    if 'group_names' not in cache:
+        user = getCurrentUser()
+        acl_back = current_app.config.get('MTJ_ACL')
+        cache['group_names'] = [
+            gp.name for gp in acl_back.getUserGroups(user)]
+    return cache['group_names']
+
+@timed('helpers')
 def getCurrentUserRoles():
-    user = getCurrentUser()
-    acl_back = current_app.config.get('MTJ_ACL')
-    if acl_back is None:
-        return []
-    return acl_back.getUserRoles(user)
+    cache = getCurrentUserCache()
+    if 'roles' not in cache:
+        user = getCurrentUser()
+        acl_back = current_app.config.get('MTJ_ACL')
+        if acl_back is None:
+            return []
+        start = default_timer()
+        cache['roles'] = acl_back.getUserRoles(user)
+        observe('mtj_acl_role_resolution_seconds', default_timer() - start)
+    return cache['roles']
 
 def getRoles():
     return sorted(list(_roles))
@@ -32,15 +59,17 @@ def register_role(role):
     _roles.add(role)
     return RoleNeed(role)
 
+@timed('helpers')
 def verifyUserGroupByName(group):
     if not group in getCurrentUserGroupNames():
         abort(403)
     return True
 
+@timed('helpers')
 def verifyUserRole(*roles):
-    acl_back = current_app.config.get('MTJ_ACL')
+    user_roles = getCurrentUserRoles()
     for role in roles:
-        if role in getCurrentUserRoles():
+        if role in user_roles:
             return True
     if not current_app.config.get('MTJ_IGNORE_PERMIT'):
         abort(403)
@@ -0,0 +1,226 @@
+from __future__ import absolute_import
+
+import binascii
+import os
+import threading
+import time
+
+from multiprocessing.pool import Pool, ThreadPool
+
+from passlib.context import CryptContext
+
+from mtj.flask.acl.exc import HashTimeoutError
+
+
+class PasswordHasher(object):
+    """
+    Password hasher based on a passlib ``CryptContext``.
+
+    New hashes are generated with the first of the schemes using the
+    given number of rounds (or the passlib default).  Hashes of the
+    other schemes, or with rounds outside of ``min_rounds`` and
+    ``max_rounds``, are considered outdated and should be replaced.
+    """
+
+    def __init__(self, schemes=('sha256_crypt',), rounds=None,
+            min_rounds=None, max_rounds=None):
+        self.schemes = list(schemes)
+        self.rounds = rounds
+        self.min_rounds = min_rounds
+        self.max_rounds = max_rounds
+        self.context = self._makeContext(rounds)
+        self._dummy_hash = None
+
+    @property
+    def dummy_hash(self):
+        """
+        A hash of a random password made with the current settings, for
+        verifying against when there is no user, so that the time
+        taken matches the verification of an existing user.
+        """
+
+        if self._dummy_hash is None:
+            self._dummy_hash = self.encrypt(binascii.hexlify(os.urandom(16)))
+        return self._dummy_hash
+
+    def _makeContext(self, rounds):
+        scheme = self.schemes[0]
+        kw = {}
+        for key, value in (
+                ('default_rounds', rounds),
+                ('min_rounds', self.min_rounds),
+                ('max_rounds', self.max_rounds)):
+            if value is not None:
+                kw['%s__%s' % (scheme, key)] = value
+        return CryptContext(schemes=self.schemes, default=scheme,
+            deprecated=self.schemes[1:], **kw)
+
+    def __getstate__(self):
+        # CryptContext cannot be pickled, rebuild it instead.
+        state = self.__dict__.copy()
+        del state['context']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.context = self._makeContext(self.rounds)
+
+    def encrypt(self, password):
+        return _hash(self.context, password)
+
+    def verify(self, password, password_hash):
+        return self.context.verify(password, password_hash)
+
+    def verify_and_update(self, password, password_hash):
+        """
+        Verify the password, returning a tuple of the result and the
+        replacement hash if the current hash is outdated (or None).
+        """
+
+        return self.context.verify_and_update(password, password_hash)
+
+    def needs_update(self, password_hash):
+        return self.context.needs_update(password_hash)
+
+    def identify(self, password_hash):
+        """
+        Return the name of the scheme of the hash, or None if it is not
+        a hash of any of the schemes.
+        """
+
+        try:
+            return self.context.identify(password_hash)
+        except (TypeError, ValueError):
+            return None
+
+    def calibrate(self, target=0.1, tolerance=2, samples=3,
+            sample_rounds=10000):
+        """
+        Set the rounds such that hashing (and so verifying) a password
+        takes about target seconds on this host.  Hashes with rounds
+        beyond the tolerance factor of that become outdated.
+
+        Returns the calibrated number of rounds.
+        """
+
+        scheme = self.schemes[0]
+        handler = self.context.handler(scheme)
+        sample_rounds = max(sample_rounds, handler.min_rounds)
+        context = CryptContext(schemes=[scheme],
+            **{'%s__default_rounds' % scheme: sample_rounds})
+        elapsed = None
+        for i in range(samples):
+            start = time.time()
+            _hash(context, 'calibration')
+            duration = time.time() - start
+            if elapsed is None or duration < elapsed:
+                elapsed = duration
+
+        rounds = int(sample_rounds * target / max(elapsed, 1e-6))
+        rounds = min(max(rounds, handler.min_rounds), handler.max_rounds)
+
+        self.rounds = rounds
+        if tolerance:
+            self.min_rounds = max(handler.min_rounds,
+                int(rounds / tolerance))
+            self.max_rounds = min(handler.max_rounds,
+                int(rounds * tolerance))
+        self.context = self._makeContext(rounds)
+        self._dummy_hash = None
+        return rounds
+
+
+def _hash(context, password):
+    # passlib 1.7 renamed encrypt to hash.
+    f = getattr(context, 'hash', None) or context.encrypt
+    return f(password)
+
+default_hasher = PasswordHasher()
+
+
+class HashExecutor(object):
+    """
+    Runs the password hashing and verification in a pool of workers,
+    with at most ``max_pending`` calls running or queued at any time.
+    Calls that cannot be queued within ``timeout`` seconds fail with a
+    ``HashTimeoutError`` instead of tying up the request thread.
+
+    Thread workers are used by default; set ``processes`` for a pool of
+    processes, in which case the called functions must be picklable.
+    """
+
+    def __init__(self, workers=4, max_pending=None, timeout=5,
+            processes=False):
+        if max_pending is None:
+            max_pending = workers * 4
+
+        self.workers = workers
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self.processes = processes
+
+        self.pending = 0
+        self.completed = 0
+        self.rejected = 0
+        self.wait_time = 0.0
+
+        self._pool = None
+        self._cond = threading.Condition()
+
+    @property
+    def pool(self):
+        # created on first use, i.e. after the application server has
+        # forked its workers.
+        if self._pool is None:
+            with self._cond:
+                if self._pool is None:
+                    if self.processes:
+                        self._pool = Pool(self.workers)
+                    else:
+                        self._pool = ThreadPool(self.workers)
+        return self._pool
+
+    def _acquire(self):
+        start = time.time()
+        with self._cond:
+            while self.pending >= self.max_pending:
+                remaining = None
+                if self.timeout is not None:
+                    remaining = start + self.timeout - time.time()
+                    if remaining <= 0:
+                        self.rejected += 1
+                        raise HashTimeoutError
+                self._cond.wait(remaining)
+            self.pending += 1
+            self.wait_time += time.time() - start
+
+    def _release(self):
+        with self._cond:
+            self.pending -= 1
+            self.completed += 1
+            self._cond.notify()
+
+    def run(self, f, *a):
+        """
+        Run f with the arguments in the pool and return its result.
+        """
+
+        self._acquire()
+        try:
+            return self.pool.apply_async(f, a).get()
+        finally:
+            self._release()
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+
+    def stats(self):
+        return {
+            'pending': self.pending,
+            'completed': self.completed,
+            'rejected': self.rejected,
+            'wait_time': self.wait_time,
+        }
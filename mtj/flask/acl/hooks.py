@@ -4,17 +4,26 @@ from mtj.flask.acl.flask import getCurrentUser
 from mtj.flask.acl.base import anonymous
 
 from . import csrf
+from .metrics import inc
+from .timing import timed
 
+@timed('csrf')
 def csrf_protect():
     current_user = getCurrentUser()
     if current_user in (anonymous, None):
         # zero protection for anonymous users.
         return
-    g.csrf_input = current_app.config['MTJ_CSRF'].render()
+    # only rendered by the templates that embed it.
+    g.csrf_input = current_app.config['MTJ_CSRF'].lazyInput(
+        current_user.login)
     if request.method == 'POST':
-        token = request.form.get(csrf.csrf_key)
-        if token != current_app.config['MTJ_CSRF'].getSecretFor(
-                current_user.login):
+        # a token in the header is checked without parsing the body,
+        # so uploads with a bad token are rejected unread.
+        token = request.headers.get(csrf.csrf_header)
+        if token is None:
+            token = request.form.get(csrf.csrf_key)
+        if not g.csrf_input.verify(token):
+            inc('mtj_acl_csrf_rejections_total')
             # TODO make this 403 specific to token failure (tell user
             # to reload the form in case of changes in hash.
             abort(403)
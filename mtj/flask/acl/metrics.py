@@ -0,0 +1,211 @@
+from __future__ import absolute_import
+
+import bisect
+import threading
+
+from flask import current_app, g, request
+from flask import has_app_context
+
+default_buckets = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25,
+    0.5, 1.0, 2.5, 5.0, 10.0)
+
+# name -> (type, help)
+definitions = {
+    'mtj_acl_login_total': ('counter',
+        'Login attempts by outcome.'),
+    'mtj_acl_hash_verify_seconds': ('histogram',
+        'Time taken to verify a password hash.'),
+    'mtj_acl_token_validations_total': ('counter',
+        'Access token validations by result.'),
+    'mtj_acl_role_resolution_seconds': ('histogram',
+        'Time taken to resolve the roles of a user from the backend.'),
+    'mtj_acl_csrf_rejections_total': ('counter',
+        'Requests rejected for a missing or invalid CSRF token.'),
+    'mtj_acl_request_overhead_seconds': ('histogram',
+        'Time spent in the ACL per request by endpoint.'),
+    'mtj_acl_cache_hits_total': ('counter',
+        'Cache hits by cache.'),
+    'mtj_acl_cache_misses_total': ('counter',
+        'Cache misses by cache.'),
+    'mtj_acl_cache_size': ('gauge',
+        'Number of entries by cache.'),
+    'mtj_acl_login_throttled_total': ('counter',
+        'Login attempts rejected by the throttle.'),
+    'mtj_acl_rejected_inputs_total': ('counter',
+        'Logins, passwords or forms rejected for their length.'),
+    'mtj_acl_hash_pending': ('gauge',
+        'Password hashing calls running or queued in the executor.'),
+    'mtj_acl_hash_rejected_total': ('counter',
+        'Password hashing calls that could not be queued in time.'),
+}
+
+
+class Metrics(object):
+    """
+    Counters and histograms exported in the Prometheus text format.
+
+    Values are updated under a lock, which is held only for the update
+    itself.  The counters kept by the ACL, its cache, the CSRF
+    authenticator, the login throttle and the hash executor of the app
+    are collected when rendered.
+    """
+
+    def __init__(self, buckets=default_buckets):
+        self.buckets = tuple(sorted(float(b) for b in buckets))
+        self._counters = {}
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                # bucket counts, the +Inf bucket, then the sum.
+                histogram = self._histograms[key] = [0] * (
+                    len(self.buckets) + 2)
+            histogram[index] += 1
+            histogram[-1] += value
+
+    def values(self):
+        """
+        Return copies of the counters and histograms.
+        """
+
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = dict((key, list(value))
+                for key, value in self._histograms.items())
+        return counters, histograms
+
+    def collect(self, app):
+        """
+        Return the counters and gauges of the components of the app as
+        a dict of (name, labels) to their values.
+        """
+
+        config = app.config
+        acl = config.get('MTJ_ACL')
+        results = {}
+
+        caches = [
+            ('acl', getattr(acl, 'cache', None)),
+            ('csrf', getattr(config.get('MTJ_CSRF'), 'cache', None)),
+        ]
+        for label, cache in caches:
+            if cache is None:
+                continue
+            labels = (('cache', label),)
+            stats = cache.stats()
+            results[('mtj_acl_cache_hits_total', labels)] = stats['hits']
+            results[('mtj_acl_cache_misses_total', labels)] = stats['misses']
+            results[('mtj_acl_cache_size', labels)] = stats['size']
+
+        throttle = config.get('MTJ_THROTTLE')
+        if throttle is not None:
+            results[('mtj_acl_login_throttled_total', ())] = (
+                throttle.throttled)
+
+        if hasattr(acl, 'rejected_inputs'):
+            results[('mtj_acl_rejected_inputs_total', ())] = (
+                acl.rejected_inputs)
+
+        executor = getattr(acl, 'hash_executor', None)
+        if executor is not None:
+            stats = executor.stats()
+            results[('mtj_acl_hash_pending', ())] = stats['pending']
+            results[('mtj_acl_hash_rejected_total', ())] = stats['rejected']
+
+        return results
+
+    def render(self, app=None):
+        if app is None:
+            app = current_app._get_current_object()
+
+        counters, histograms = self.values()
+        counters.update(self.collect(app))
+
+        by_name = {}
+        for (name, labels), value in counters.items():
+            by_name.setdefault(name, []).append((labels, value))
+        for (name, labels), value in histograms.items():
+            by_name.setdefault(name, []).append((labels, value))
+
+        lines = []
+        for name in sorted(by_name):
+            kind, description = definitions.get(name, ('untyped', name))
+            lines.append('# HELP %s %s' % (name, description))
+            lines.append('# TYPE %s %s' % (name, kind))
+            for labels, value in sorted(by_name[name]):
+                if kind == 'histogram':
+                    lines.extend(self._histogram(name, labels, value))
+                else:
+                    lines.append('%s%s %s' % (
+                        name, _labels(labels), _value(value)))
+        return '\n'.join(lines) + '\n'
+
+    def _histogram(self, name, labels, value):
+        count = 0
+        for bucket, bucket_count in zip(
+                [_value(b) for b in self.buckets] + ['+Inf'], value[:-1]):
+            count += bucket_count
+            yield '%s_bucket%s %d' % (
+                name, _labels(labels + (('le', bucket),)), count)
+        yield '%s_sum%s %s' % (name, _labels(labels), _value(value[-1]))
+        yield '%s_count%s %d' % (name, _labels(labels), count)
+
+    def afterRequest(self, response):
+        """
+        Observe the time spent in the ACL for the request by endpoint,
+        as recorded by ``mtj.flask.acl.timing``.
+        """
+
+        timing = g.get('mtj_acl_timing')
+        if timing is not None:
+            self.observe('mtj_acl_request_overhead_seconds', timing.time,
+                endpoint=request.endpoint or '')
+        return response
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    return '{%s}' % ','.join('%s="%s"' % (key, str(value).replace(
+        '\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for key, value in labels)
+
+
+def _value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def getMetrics():
+    if not has_app_context():
+        return None
+    return current_app.config.get('MTJ_METRICS')
+
+
+def inc(name, value=1, **labels):
+    """
+    Increment the counter in the metrics of the current app, if any.
+    """
+
+    metrics = getMetrics()
+    if metrics is not None:
+        metrics.inc(name, value, **labels)
+
+
+def observe(name, value, **labels):
+    """
+    Observe the value in the metrics of the current app, if any.
+    """
+
+    metrics = getMetrics()
+    if metrics is not None:
+        metrics.observe(name, value, **labels)
@@ -1,5 +1,8 @@
 from __future__ import absolute_import
 
+from collections import MutableSet
+from timeit import default_timer
+
 from werkzeug.exceptions import HTTPException
 
 from flask import current_app
@@ -18,6 +21,60 @@ from flask.ext.principal import Identity
 from flask.ext.principal import AnonymousIdentity
 
 from .base import anonymous
+from .flask import getCurrentUser
+from .flask import getCurrentUserCache
+from .flask import getCurrentUserRoles
+from .metrics import observe
+from .timing import after_request
+from .timing import timed
+
+
+class LazyNeeds(MutableSet):
+    """
+    Set of needs where the bulk of them are only loaded from the loader
+    when first accessed.
+    """
+
+    def __init__(self, loader, needs=()):
+        self._loader = loader
+        self._needs = set(needs)
+        self._discarded = set()
+
+    @property
+    def loaded(self):
+        return self._loader is None
+
+    def _load(self):
+        if self._loader is None:
+            return self._needs
+        loader = self._loader
+        self._loader = None
+        self._needs.update(set(loader()) - self._discarded)
+        self._discarded = None
+        return self._needs
+
+    def __contains__(self, need):
+        return need in self._load()
+
+    def __iter__(self):
+        return iter(self._load())
+
+    def __len__(self):
+        return len(self._load())
+
+    def add(self, need):
+        if self._discarded:
+            self._discarded.discard(need)
+        self._needs.add(need)
+
+    def discard(self, need):
+        if self._loader is not None:
+            self._discarded.add(need)
+        self._needs.discard(need)
+
+    def __repr__(self):
+        return '<LazyNeeds %r>' % (
+            self._needs if self.loaded else 'not loaded')
 
 
 class AclIdentity(Identity):
@@ -66,6 +123,7 @@ def init_app(acl, app, mtjacl_sessions=True,
     principal = Principal(app, use_sessions=False, *a, **kw)
 
     @identity_loaded.connect_via(app)
+    @timed('identity')
     def on_identity_loaded(sender, identity):
         if not isinstance(identity, AclIdentity):
             # Not doing anything on identities we don't care for.
@@ -73,19 +131,39 @@ def init_app(acl, app, mtjacl_sessions=True,
 
         # the identity is actually the raw token
         access_token = identity.access_token
-        if access_token is None:
+        group_names = roles = None
+        if access_token is None or not acl.validateAccessToken(
+                access_token):
             user = anonymous
         else:
-            user = acl.getUserFromAccessToken(access_token)
+            start = default_timer()
+            user, group_names, roles = acl.loadPrincipal(
+                access_token['login'])
+            if roles is not None:
+                observe('mtj_acl_role_resolution_seconds',
+                    default_timer() - start)
+        if user is None:
+            user = anonymous
         # cache this value.
         g.mtj_user = user
         if user is anonymous:
             return
-        roles = acl.getUserRoles(user)
-        # TODO figure out how to do lazy loading of roles.
-        for role in roles:
-            identity.provides.add(RoleNeed(role))
 
+        # shared with the flask helpers through the request cache.
+        cache = getCurrentUserCache()
+        if group_names is not None:
+            cache['group_names'] = group_names
+        if roles is not None:
+            cache['roles'] = roles
+
+        def load_roles():
+            if getCurrentUser() is user:
+                roles = getCurrentUserRoles()
+            else:
+                roles = acl.getUserRoles(user)
+            return [RoleNeed(role) for role in roles]
+
+        identity.provides = LazyNeeds(load_roles, identity.provides)
         identity.id = user.login
 
     if mtjacl_sessions:
@@ -97,6 +175,7 @@ def init_app(acl, app, mtjacl_sessions=True,
         app.errorhandler(PermissionDenied)(permission_denied_handler)
 
     app.before_request(_on_before_request(acl))
+    app.after_request(after_request)
 
 def _on_before_request(acl):
     def on_before_request():
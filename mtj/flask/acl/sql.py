@@ -1,41 +1,80 @@
 import logging
-
-from passlib.hash import sha256_crypt
+import sys
+from collections import OrderedDict
+from contextlib import contextmanager
+from timeit import default_timer
 
 import sqlalchemy
-from sqlalchemy import Column, Integer, String, MetaData
+from sqlalchemy import Column, Integer, String, Float, MetaData, Index
+from sqlalchemy import and_, or_
 from sqlalchemy import create_engine
+from sqlalchemy import event
 from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import scoped_session
 from sqlalchemy.orm import sessionmaker
 
 from mtj.flask.acl.base import BaseAcl
+from mtj.flask.acl.exc import HashTimeoutError
+from mtj.flask.acl.exc import InputTooLongError
+from mtj.flask.acl.hashing import PasswordHasher
+from mtj.flask.acl.hashing import default_hasher
+from mtj.flask.acl.metrics import observe
+from mtj.flask.acl.timing import count_query
+from mtj.flask.acl.timing import timed
+from mtj.flask.acl.tokens import BaseTokenStore
 from mtj.flask.acl import flask
 
+_marker = object()
+
+# maximum number of values bound in a single IN clause.
+_chunk_size = 500
+
+# keyword arguments of SqlAcl that are passed to the engine.
+_engine_options = ('pool_size', 'max_overflow', 'pool_timeout',
+    'pool_recycle', 'pool_pre_ping', 'poolclass', 'connect_args')
+
 Base = declarative_base()
 
+# kept apart such that the table is only created by the SqlTokenStore.
+TokenBase = declarative_base()
+
 logger = logging.getLogger('mtj.flask.acl.sqlacl')
 
 
+def hash_password(password, hasher=default_hasher):
+    # TODO fix this probable bad practices
+    assert isinstance(password, basestring)
+    assert len(password) > 5
+    return hasher.encrypt(password)
+
+
+def verify_password(password, password_hash, hasher=default_hasher):
+    return hasher.verify_and_update(password, password_hash)
+
+
 class User(Base):
 
     __tablename__ = 'user'
 
     login = Column(String(255), primary_key=True)
     password = Column(String(255))
-    name = Column(String(255))
-    email = Column(String(255))
+    name = Column(String(255), index=True)
+    email = Column(String(255), index=True)
 
-    def __init__(self, login, password, name=None, email=None, *a, **kw):
+    def __init__(self, login, password=None, name=None, email=None,
+            *a, **kw):
         self.login = login
         self.name = name
         self.email = email
-        self.setPassword(password)
+        password_hash = kw.pop('password_hash', None)
+        if password_hash is not None:
+            # already hashed, i.e. from an import.
+            self.password = password_hash
+        else:
+            self.setPassword(password)
 
     def setPassword(self, password):
-        # TODO fix this probable bad practices
-        assert isinstance(password, basestring)
-        assert len(password) > 5
-        self.password = sha256_crypt.encrypt(password)
+        self.password = hash_password(password)
 
 
 class Group(Base):
@@ -76,26 +115,288 @@ class GroupRole(Base):
         self.role = role
 
 
+class AccessToken(TokenBase):
+
+    __tablename__ = 'access_token'
+    __table_args__ = (
+        Index('ix_access_token_login_token', 'login', 'token'),
+    )
+
+    id = Column(Integer, primary_key=True)
+    login = Column(String(255))
+    token = Column(String(64))
+    issued = Column(Float)
+    expires = Column(Float, index=True)
+
+    def __init__(self, login, token, issued, expires=None):
+        self.login = login
+        self.token = token
+        self.issued = issued
+        self.expires = expires
+
+
+def _chunked(values, size=_chunk_size):
+    values = list(values)
+    for i in range(0, len(values), size):
+        yield values[i:i + size]
+
+
+def _create_indexes(engine, table, reflected):
+    # create_all does not add new indexes to existing tables.
+    existing = set(index.name for index in reflected.indexes)
+    for index in table.indexes:
+        if index.name not in existing:
+            index.create(engine)
+
+
+def _keyset(q, column, after=None, before=None, limit=None):
+    """
+    Apply keyset pagination on the query by the column, returning the
+    results in ascending order.
+    """
+
+    if before is not None:
+        q = q.filter(column < before).order_by(column.desc())
+        if limit is not None:
+            q = q.limit(limit)
+        return list(reversed(q.all()))
+
+    if after is not None:
+        q = q.filter(column > after)
+    q = q.order_by(column)
+    if limit is not None:
+        q = q.limit(limit)
+    return q.all()
+
+
+def _prefixed(column, prefix):
+    """
+    Condition for values of the column starting with the unicode prefix
+    as a range rather than LIKE, such that the index can be used.  The
+    range is only exact where the column is compared by code point, i.e.
+    under a binary (or ``C``) collation, as with SQLite by default.
+    """
+
+    # the highest code point cannot be incremented, so drop it from the
+    # upper bound, which is left open if nothing remains.
+    stripped = prefix.rstrip(unichr(sys.maxunicode))
+    if not stripped:
+        return column >= prefix
+    upper = stripped[:-1] + unichr(ord(stripped[-1]) + 1)
+    return and_(column >= prefix, column < upper)
+
+
+@contextmanager
+def _transaction(session):
+    """
+    Commit the session at the end of the block, rolling it back if
+    anything fails such that the (scoped) session remains usable.
+    """
+
+    try:
+        yield session
+        session.commit()
+    except:
+        session.rollback()
+        raise
+
+
+def _token_id(ts):
+    # floats are stored by their repr to avoid any loss of precision.
+    return repr(float(ts))
+
+
+class SqlTokenStore(BaseTokenStore):
+    """
+    Access token store backed by a table, for sharing the tokens
+    between processes.
+
+    When provided as the ``token_store`` of a ``SqlAcl`` without an
+    engine, the engine of that ``SqlAcl`` will be used.  The table for
+    the tokens is created when the store is bound to an engine.
+    """
+
+    def __init__(self, engine=None, batch_size=500, *a, **kw):
+        super(SqlTokenStore, self).__init__(*a, **kw)
+        self.batch_size = batch_size
+        self._sessions = None
+        if engine is not None:
+            self.bind(engine)
+
+    @property
+    def bound(self):
+        return self._sessions is not None
+
+    def bind(self, engine, sessions=None):
+        table = AccessToken.__table__
+        metadata = MetaData()
+        metadata.reflect(bind=engine, only=lambda name, m: name == table.name)
+        reflected = metadata.tables.get(table.name)
+        if reflected is None:
+            TokenBase.metadata.create_all(engine)
+        else:
+            _create_indexes(engine, table, reflected)
+        if sessions is None:
+            sessions = sessionmaker(bind=engine)
+        self._sessions = sessions
+
+    def session(self):
+        return self._sessions()
+
+    def issue(self, login):
+        now = self.timer()
+        expires = None
+        if self.ttl is not None:
+            expires = now + self.ttl
+
+        session = self.session()
+        with _transaction(session):
+            session.add(AccessToken(login, _token_id(now), now, expires))
+            session.flush()
+            # evict the oldest tokens beyond the limit.
+            q = session.query(AccessToken.id).filter(
+                AccessToken.login == login).order_by(
+                AccessToken.issued.desc()).offset(self.max_tokens)
+            evicted = [i[0] for i in q.all()]
+            if evicted:
+                session.query(AccessToken).filter(
+                    AccessToken.id.in_(evicted)).delete(
+                    synchronize_session=False)
+        session.close()
+
+        self._maybeSweep(now)
+
+        return {
+            'login': login,
+            'ts': now,
+        }
+
+    def validate(self, access_token):
+        login = access_token.get('login')
+        try:
+            token = _token_id(access_token.get('ts'))
+        except (TypeError, ValueError):
+            return False
+
+        session = self.session()
+        q = session.query(AccessToken.expires).filter(
+            AccessToken.login == login, AccessToken.token == token)
+        result = q.first()
+        session.close()
+
+        if result is None:
+            return False
+        expires = result[0]
+        return expires is None or expires > self.timer()
+
+    def revoke(self, access_token):
+        login = access_token.get('login')
+        try:
+            token = _token_id(access_token.get('ts'))
+        except (TypeError, ValueError):
+            return
+
+        session = self.session()
+        with _transaction(session):
+            session.query(AccessToken).filter(
+                AccessToken.login == login,
+                AccessToken.token == token).delete(synchronize_session=False)
+        session.close()
+
+    def revokeAll(self, login):
+        session = self.session()
+        with _transaction(session):
+            session.query(AccessToken).filter(
+                AccessToken.login == login).delete(synchronize_session=False)
+        session.close()
+
+    def sweep(self, now=None):
+        if now is None:
+            now = self.timer()
+
+        session = self.session()
+        while True:
+            # delete in batches to avoid holding long locks.
+            with _transaction(session):
+                q = session.query(AccessToken.id).filter(
+                    AccessToken.expires <= now).limit(self.batch_size)
+                expired = [i[0] for i in q.all()]
+                if expired:
+                    session.query(AccessToken).filter(
+                        AccessToken.id.in_(expired)).delete(
+                        synchronize_session=False)
+            if len(expired) < self.batch_size:
+                break
+        session.close()
+
+    def logins(self):
+        session = self.session()
+        q = session.query(AccessToken.login).distinct()
+        results = [i[0] for i in q.all()]
+        session.close()
+        return results
+
+
 class SqlAcl(BaseAcl):
     """
     Low level SQLAlchemy basd ACL backend.
+
+    An optional ``cache`` (i.e. an instance of
+    ``mtj.flask.acl.cache.LRUCache``) may be provided to keep the
+    results of user, group and role lookups across requests.  Cached
+    entries are only invalidated in the process making a change, so
+    other processes see it once their entries expire after the ``ttl``
+    of the cache; passwords are always validated against the database.
+
+    For deployments with multiple processes, provide a
+    ``SqlTokenStore`` as the ``token_store`` such that access tokens
+    are shared through the database.
+
+    Sessions are scoped to the current thread and are removed at the
+    teardown of the app context of the app this is hooked with.  The
+    connection pool can be configured using the ``pool_size``,
+    ``max_overflow``, ``pool_timeout``, ``pool_recycle``,
+    ``pool_pre_ping``, ``poolclass`` and ``connect_args`` keyword
+    arguments, which are passed to ``sqlalchemy.create_engine``.
+
+    Passwords are hashed using the ``hasher``, which defaults to a new
+    ``mtj.flask.acl.hashing.PasswordHasher`` with the passlib defaults;
+    outdated hashes are replaced on successful validation.  Password
+    hashing can be moved off the request thread by providing a
+    ``mtj.flask.acl.hashing.HashExecutor`` as the ``hash_executor``.
     """
 
     def __init__(self, src=None, *a, **kw):
+        self.cache = kw.pop('cache', None)
+        self.hasher = kw.pop('hasher', None)
+        if self.hasher is None:
+            # not shared, as calibrating one would change all of them.
+            self.hasher = PasswordHasher()
+        self.hash_executor = kw.pop('hash_executor', None)
+        engine_options = dict(
+            (k, kw.pop(k)) for k in _engine_options if k in kw)
+
         # XXX for the session/access token table.
         super(SqlAcl, self).__init__(*a, **kw)
 
         if not src:
             src = 'sqlite://'
 
-        self._conn = create_engine(src)
+        self._conn = create_engine(src, **engine_options)
+        event.listen(self._conn, 'before_cursor_execute', count_query)
         self._metadata = MetaData()
         self._metadata.reflect(bind=self._conn)
         Base.metadata.create_all(self._conn)
-        # XXX scoped_session needed here
-        self._sessions = sessionmaker(
+        self._createIndexes()
+        # instances are not expired on commit as they are used (and
+        # cached) beyond the lifetime of their session.
+        self._sessions = scoped_session(sessionmaker(
             bind=self._conn,
-        )
+            expire_on_commit=False,
+        ))
+        if (isinstance(self.token_store, SqlTokenStore) and
+                not self.token_store.bound):
+            self.token_store.bind(self._conn, self._sessions)
 
         # XXX also need to autoinsert hook from somewhere...
 
@@ -115,8 +416,9 @@ class SqlAcl(BaseAcl):
 
         admin_grp = Group('admin', 'Adminstrator group')
         session = self.session()
-        session.merge(admin_grp)
-        session.commit()
+        with _transaction(session):
+            session.merge(admin_grp)
+        self._invalidateGroup(admin_grp.name)
 
         self.setUserGroups(user, ('admin',))
 
@@ -124,34 +426,131 @@ class SqlAcl(BaseAcl):
         roles.add('admin')
         self.setGroupRoles(admin_grp, roles)
 
+    def _createIndexes(self):
+        for table in Base.metadata.sorted_tables:
+            reflected = self._metadata.tables.get(table.name)
+            if reflected is not None:
+                _create_indexes(self._conn, table, reflected)
+
     def session(self):
         return self._sessions()
 
+    def removeSession(self, *a):
+        """
+        Remove the session for the current scope, returning its
+        connection to the pool.
+        """
+
+        self._sessions.remove()
+
+    def init_app(self, app, *a, **kw):
+        result = super(SqlAcl, self).init_app(app, *a, **kw)
+        app.teardown_appcontext(self.removeSession)
+        return result
+
+    def _hashCall(self, f, *a):
+        if self.hash_executor is None:
+            return f(*a)
+        return self.hash_executor.run(f, *a)
+
+    def _newUser(self, login, password=None, *a, **kw):
+        self.checkInput(login, password)
+        if kw.get('password_hash') is None:
+            kw['password_hash'] = self._hashCall(hash_password, password,
+                self.hasher)
+        return User(login, None, *a, **kw)
+
+    # cache management
+
+    def _cached(self, key, f, *a):
+        if self.cache is None:
+            return f(*a)
+
+        result = self.cache.get(key, _marker)
+        if result is _marker:
+            result = f(*a)
+            # misses are not kept so new records are found immediately.
+            if result is not None:
+                self.cache.set(key, result)
+        return result
+
+    def _invalidateUser(self, login, *kinds):
+        if self.cache is None:
+            return
+        self.cache.discard(*[(kind, login) for kind in kinds])
+
+    def _invalidateGroup(self, group_name, roles=False):
+        """
+        Invalidate the cached entries of the members of the group, the
+        group roles and the roles of the members if ``roles`` is set.
+        """
+
+        if self.cache is None:
+            return
+
+        session = self.session()
+        q = session.query(UserGroup.user).filter(
+            UserGroup.group == group_name)
+        logins = [i[0] for i in q.all()]
+        session.close()
+
+        keys = [('user_groups', login) for login in logins]
+        if roles:
+            keys.append(('group_roles', group_name))
+            keys.extend(('user_roles', login) for login in logins)
+            keys.extend(('principal', login) for login in logins)
+        self.cache.discard(*keys)
+
+    @timed('backend')
     def validate(self, login, password):
-        user = self.getUser(login)
+        self.checkInput(login, password)
+        # not cached, such that a changed password takes effect in all
+        # processes immediately.
+        user = self._getUser(login)
         if user is None:
-            # Data leakage potential via timing attack.  Mitigation: 
-            # generate a new crypt to emuluate the time spent on
-            # crypting/comparing the result.
-            # TODO verify timings as crypt.verify does a bit more than
-            # this.
+            # Data leakage potential via timing attack.  Mitigation:
+            # verify against a dummy hash made with the same settings
+            # to take the same time as verifying an existing user.
             try:
-                sha256_crypt.encrypt(password)
+                self._verify(password, self.hasher.dummy_hash)
+            except HashTimeoutError:
+                raise
             except:
                 pass
             return False
 
         try:
-            result = sha256_crypt.verify(password, user.password)
-        except TypeError:
+            result, new_hash = self._verify(password, user.password)
+        except (TypeError, ValueError):
             # this can be caused if password is empty.
             return False
 
+        if result and new_hash:
+            self._rehash(login, new_hash)
+
         return result
 
+    def _verify(self, password, password_hash):
+        start = default_timer()
+        try:
+            return self._hashCall(verify_password, password, password_hash,
+                self.hasher)
+        finally:
+            observe('mtj_acl_hash_verify_seconds', default_timer() - start)
+
+    def _rehash(self, login, password_hash):
+        session = self.session()
+        with _transaction(session):
+            session.query(User).filter(User.login == login).update(
+                {'password': password_hash}, synchronize_session=False)
+        self._invalidateUser(login, 'user', 'principal')
+
+    @timed('backend')
     def register(self, *a, **kw):
         try:
-            u = User(*a, **kw)
+            u = self._newUser(*a, **kw)
+        except (HashTimeoutError, InputTooLongError):
+            raise
         except:
             return False
 
@@ -159,21 +558,58 @@ class SqlAcl(BaseAcl):
             return False
 
         session = self.session()
-        session.add(u)
-        session.commit()
+        with _transaction(session):
+            session.add(u)
         return True
 
-    def listUsers(self):
+    @timed('backend')
+    def listUsers(self, after=None, before=None, limit=None):
+        """
+        List users ordered by login, optionally only those after or
+        before the provided login, up to the limit.
+        """
+
         session = self.session()
         q = session.query(User)
-        return q.all()
+        return _keyset(q, User.login, after, before, limit)
+
+    @timed('backend')
+    def searchUsers(self, query, limit=50):
+        """
+        Search for users where their login, name or email starts with
+        the query (case sensitive), ordered by login.  Byte string
+        queries are decoded as UTF-8.
+        """
+
+        if not query:
+            return []
+        if not isinstance(query, unicode):
+            try:
+                query = query.decode('utf8')
+            except UnicodeDecodeError:
+                return []
 
+        session = self.session()
+        q = session.query(User).filter(or_(
+            _prefixed(User.login, query),
+            _prefixed(User.name, query),
+            _prefixed(User.email, query),
+        )).order_by(User.login).limit(limit)
+        results = q.all()
+        session.close()
+        return results
+
+    @timed('backend')
     def getUser(self, login):
+        return self._cached(('user', login), self._getUser, login)
+
+    def _getUser(self, login):
         session = self.session()
         q = session.query(User).filter(User.login == login)
         session.close()
         return q.first()
 
+    @timed('backend')
     def getGroup(self, group_name):
         session = self.session()
         q = session.query(Group).filter(Group.name == group_name)
@@ -183,25 +619,30 @@ class SqlAcl(BaseAcl):
     def addGroup(self, name, description=None):
         g = Group(name, description)
         session = self.session()
-        session.add(g)
-        session.commit()
+        with _transaction(session):
+            session.add(g)
+
+    @timed('backend')
+    def listGroups(self, after=None, before=None, limit=None):
+        """
+        List groups ordered by name, optionally only those after or
+        before the provided name, up to the limit.
+        """
 
-    def listGroups(self):
         session = self.session()
         q = session.query(Group)
-        return q.all()
+        return _keyset(q, Group.name, after, before, limit)
 
+    @timed('backend')
     def setUserGroups(self, user, groups):
-        all_groups = {g.name for g in self.listGroups()}
-        session = self.session()
-        session.query(UserGroup).filter(UserGroup.user == user.login).delete()
-        for group in set(groups):
-            if group not in all_groups:
-                continue
-            session.add(UserGroup(user.login, group))
-        session.commit()
+        self.setUserGroupsMany({user.login: groups})
 
+    @timed('backend')
     def getUserGroups(self, user):
+        return list(self._cached(('user_groups', user.login),
+            self._getUserGroups, user))
+
+    def _getUserGroups(self, user):
         session = self.session()
         q = session.query(Group).filter(Group.name.in_(
             session.query(UserGroup.group).filter(UserGroup.user == user.login)
@@ -210,8 +651,10 @@ class SqlAcl(BaseAcl):
         session.close()
         return results
 
+    @timed('backend')
     def editUser(self, login, name=None, email=None):
-        user = self.getUser(login)
+        # not using the cached copy as it is modified.
+        user = self._getUser(login)
         if not user:
             return False
 
@@ -219,10 +662,12 @@ class SqlAcl(BaseAcl):
         user.email = email
 
         session = self.session()
-        session.merge(user)
-        session.commit()
+        with _transaction(session):
+            session.merge(user)
+        self._invalidateUser(login, 'user', 'principal')
         return True
 
+    @timed('backend')
     def editGroup(self, group_name, description=None):
         group = self.getGroup(group_name)
         if not group:
@@ -231,38 +676,52 @@ class SqlAcl(BaseAcl):
         group.description = description
 
         session = self.session()
-        session.merge(group)
-        session.commit()
+        with _transaction(session):
+            session.merge(group)
+        self._invalidateGroup(group_name)
         return True
 
+    @timed('backend')
     def updatePassword(self, login, password):
-        user = self.getUser(login)
+        self.checkInput(password=password)
+        user = self._getUser(login)
         if not user:
             return False
 
         try:
-            user.setPassword(password)
+            user.password = self._hashCall(hash_password, password,
+                self.hasher)
+        except HashTimeoutError:
+            raise
         except:
             return False
 
         session = self.session()
-        session.merge(user)
-        session.commit()
+        with _transaction(session):
+            session.merge(user)
+        self._invalidateUser(login, 'user', 'principal')
         return True
 
     # roles
 
+    @timed('backend')
     def setGroupRoles(self, group, roles):
         session = self.session()
-        session.query(GroupRole).filter(
-            GroupRole.group == group.name).delete()
-        for role in set(roles):
-            if role not in flask._roles:
-                continue
-            session.merge(GroupRole(group.name, role))
-        session.commit()
-
+        with _transaction(session):
+            session.query(GroupRole).filter(
+                GroupRole.group == group.name).delete()
+            for role in set(roles):
+                if role not in flask._roles:
+                    continue
+                session.merge(GroupRole(group.name, role))
+        self._invalidateGroup(group.name, roles=True)
+
+    @timed('backend')
     def getGroupRoles(self, group):
+        return set(self._cached(('group_roles', group.name),
+            self._getGroupRoles, group))
+
+    def _getGroupRoles(self, group):
         session = self.session()
         q = session.query(GroupRole.role).filter(
             GroupRole.group == group.name)
@@ -270,7 +729,12 @@ class SqlAcl(BaseAcl):
         session.close()
         return results
 
+    @timed('backend')
     def getUserRoles(self, user):
+        return set(self._cached(('user_roles', user.login),
+            self._getUserRoles, user))
+
+    def _getUserRoles(self, user):
         session = self.session()
         q = session.query(GroupRole.role).join(Group,
             GroupRole.group == Group.name).filter(Group.name.in_(
@@ -280,3 +744,129 @@ class SqlAcl(BaseAcl):
         results = set(i[0] for i in q.all())
         session.close()
         return results
+
+    @timed('backend')
+    def loadPrincipal(self, login):
+        result = self._cached(('principal', login), self._loadPrincipal,
+            login)
+        if result is None:
+            return None, [], set()
+        user, group_names, roles = result
+        return user, list(group_names), set(roles)
+
+    def _loadPrincipal(self, login):
+        session = self.session()
+        q = session.query(User, Group.name, GroupRole.role).outerjoin(
+            UserGroup, UserGroup.user == User.login).outerjoin(
+            Group, Group.name == UserGroup.group).outerjoin(
+            GroupRole, GroupRole.group == Group.name).filter(
+            User.login == login)
+        rows = q.all()
+        session.close()
+
+        if not rows:
+            return None
+
+        user = rows[0][0]
+        group_names = sorted(set(row[1] for row in rows if row[1]))
+        roles = set(row[2] for row in rows if row[2])
+        return user, group_names, roles
+
+    # bulk operations
+
+    def _existing(self, session, column, values):
+        results = set()
+        for chunk in _chunked(set(values)):
+            q = session.query(column).filter(column.in_(chunk))
+            results.update(i[0] for i in q.all())
+        return results
+
+    def registerMany(self, users):
+        """
+        Register users from an iterable of arguments to ``register``,
+        either as dicts or sequences, in a single transaction.  Users
+        that are invalid or already exist are skipped.
+
+        Returns the list of logins that were registered.
+        """
+
+        candidates = OrderedDict()
+        for args in users:
+            if isinstance(args, dict):
+                login = args.get('login')
+            else:
+                login = args[0] if args else None
+            if login:
+                candidates.setdefault(login, args)
+
+        session = self.session()
+        with _transaction(session):
+            existing = self._existing(session, User.login, candidates.keys())
+
+            # only hash the passwords of the users to be added.
+            new_users = []
+            for login, args in candidates.items():
+                if login in existing:
+                    continue
+                try:
+                    if isinstance(args, dict):
+                        new_users.append(self._newUser(**args))
+                    else:
+                        new_users.append(self._newUser(*args))
+                except HashTimeoutError:
+                    raise
+                except:
+                    continue
+
+            session.add_all(new_users)
+        return [u.login for u in new_users]
+
+    def addGroups(self, groups):
+        """
+        Add groups from an iterable of names or (name, description)
+        pairs in a single transaction.  Groups that already exist are
+        skipped.
+
+        Returns the list of names of groups that were added.
+        """
+
+        candidates = OrderedDict()
+        for group in groups:
+            if isinstance(group, basestring):
+                group = (group, None)
+            candidates.setdefault(group[0], Group(*group))
+
+        session = self.session()
+        with _transaction(session):
+            existing = self._existing(session, Group.name, candidates.keys())
+            new_groups = [g for name, g in candidates.items()
+                if name not in existing]
+            session.add_all(new_groups)
+        return [g.name for g in new_groups]
+
+    def setUserGroupsMany(self, user_groups):
+        """
+        Set the groups of many users in a single transaction, from a
+        mapping of login to the names of the groups.  Names of groups
+        that do not exist are ignored.
+        """
+
+        user_groups = dict((login, set(groups))
+            for login, groups in user_groups.items())
+        session = self.session()
+        with _transaction(session):
+            all_groups = self._existing(session, Group.name,
+                set().union(*user_groups.values()))
+
+            for chunk in _chunked(user_groups.keys()):
+                session.query(UserGroup).filter(UserGroup.user.in_(
+                    chunk)).delete(synchronize_session=False)
+            session.bulk_insert_mappings(UserGroup, [
+                {'user': login, 'group': group}
+                for login, groups in user_groups.items()
+                for group in groups if group in all_groups
+            ])
+
+        for login in user_groups:
+            self._invalidateUser(login, 'user_groups', 'user_roles',
+                'principal')
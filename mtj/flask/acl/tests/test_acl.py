@@ -1,5 +1,7 @@
+import threading
 from unittest import TestCase, TestSuite, makeSuite
 from mtj.flask.acl.base import SetupAcl
+from mtj.flask.acl.exc import InputTooLongError
 
 
 class AclTestCase(TestCase):
@@ -25,9 +27,30 @@ class AclTestCase(TestCase):
         self.assertFalse(auth.validateAccessToken(token))
 
         token = auth.generateAccessToken('user')
-        self.assertEqual(sorted(auth._tbl_access_tokens.keys()),
+        self.assertEqual(sorted(auth.token_store.logins()),
             ['admin', 'user'])
 
+        auth.revokeAccessToken(token)
+        self.assertFalse(auth.validateAccessToken(token))
+        self.assertEqual(auth.token_store.logins(), ['admin'])
+
+    def test_rejected_inputs_threads(self):
+        auth = SetupAcl('admin', 'password', max_login_length=4)
+
+        def work():
+            for i in range(1000):
+                try:
+                    auth.checkInput(login='toolong')
+                except InputTooLongError:
+                    pass
+
+        threads = [threading.Thread(target=work) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(auth.rejected_inputs, 4000)
+
 
 def test_suite():
     suite = TestSuite()
@@ -0,0 +1,244 @@
+import json
+import os
+import random
+import tempfile
+from StringIO import StringIO
+from unittest import TestCase, TestSuite, makeSuite
+
+from mtj.flask.acl import bench
+from mtj.flask.acl import sql
+from mtj.flask.acl.bench import data
+from mtj.flask.acl.bench import hotpaths
+from mtj.flask.acl.bench import loadgen
+from mtj.flask.acl.bench import parity
+from mtj.flask.acl.bench import scaling
+from mtj.flask.acl.hashing import PasswordHasher
+from mtj.flask.acl.tests.test_sqlacl import filter_gn
+
+
+class BenchTestCase(TestCase):
+
+    def setUp(self):
+        pass
+
+    def tearDown(self):
+        pass
+
+    def test_measure(self):
+        calls = []
+        now = [0]
+        def timer():
+            now[0] += 1
+            return now[0]
+        samples = bench.measure(lambda: calls.append(1), repeat=3, warmup=2,
+            timer=timer)
+        self.assertEqual(len(calls), 5)
+        self.assertEqual(samples, [1, 1, 1])
+
+    def test_summarize(self):
+        summary = bench.summarize([float(i) for i in range(100, 0, -1)])
+        self.assertEqual(summary['count'], 100)
+        self.assertEqual(summary['min'], 1)
+        self.assertEqual(summary['mean'], 50.5)
+        self.assertEqual(summary['p50'], 50)
+        self.assertEqual(summary['p95'], 95)
+        self.assertEqual(summary['p99'], 99)
+        self.assertEqual(summary['max'], 100)
+        self.assertEqual(bench.summarize([]), {'count': 0})
+        self.assertEqual(bench.percentile([1], 99), 1)
+
+    def test_compare(self):
+        baseline = {'a': {'p50': 1.0}, 'b': {'p50': 1.0}}
+        results = {'a': {'p50': 1.2}, 'b': {'p50': 1.3}, 'c': {'p50': 9}}
+        self.assertEqual(bench.compare(results, baseline, 0.25),
+            [('b', 1.0, 1.3)])
+
+    def test_dump_load(self):
+        results = bench.run([('noop', lambda: None)], repeat=3, warmup=0)
+        stream = StringIO()
+        bench.dump(results, stream, rounds=1000)
+        document = json.loads(stream.getvalue())
+        self.assertEqual(document['version'], bench.format_version)
+        self.assertEqual(document['rounds'], 1000)
+        stream.seek(0)
+        self.assertEqual(bench.load(stream), results)
+
+
+class HotPathsTestCase(TestCase):
+
+    def setUp(self):
+        fd, self.baseline = tempfile.mkstemp()
+        os.close(fd)
+        fd, self.output = tempfile.mkstemp()
+        os.close(fd)
+
+    def tearDown(self):
+        os.unlink(self.baseline)
+        os.unlink(self.output)
+
+    def test_run(self):
+        results = hotpaths.run(repeat=2, warmup=0, rounds=1000,
+            databases=('memory', 'file'))
+        self.assertTrue('memory:authenticate' in results)
+        self.assertTrue('file:page_user_list' in results)
+        self.assertEqual(results['file:csrf_protect']['count'], 2)
+
+    def test_main_baseline(self):
+        results = {'memory:authenticate': {'p50': 0.0}}
+        with open(self.baseline, 'w') as stream:
+            bench.dump(results, stream)
+        status = hotpaths.main(['--repeat', '1', '--warmup', '0',
+            '--rounds', '1000', '--database', 'memory', '--quiet',
+            '--output', self.output, '--baseline', self.baseline])
+        self.assertEqual(status, 1)
+
+        status = hotpaths.main(['--repeat', '1', '--warmup', '0',
+            '--rounds', '1000', '--database', 'memory', '--quiet',
+            '--output', self.baseline, '--baseline', self.output,
+            '--tolerance', '1000'])
+        self.assertEqual(status, 0)
+
+
+class ParityTestCase(TestCase):
+
+    def test_run(self):
+        results = parity.run(repeat=2, warmup=0, rounds=1000)
+        self.assertEqual(list(results), ['known', 'unknown'])
+        self.assertEqual(results['unknown']['count'], 2)
+
+    def test_differences(self):
+        results = {'known': {'p50': 1.0}, 'unknown': {'p50': 1.1}}
+        self.assertEqual(parity.differences(results), [])
+        results = {'known': {'p50': 1.0}, 'unknown': {'p50': 0.5}}
+        self.assertEqual(parity.differences(results),
+            [('known', 0.5, 1.0)])
+        self.assertEqual(parity.differences(results, tolerance=1), [])
+        results = {'known': {'p50': 0.5}, 'unknown': {'p50': 1.0}}
+        self.assertEqual(parity.differences(results),
+            [('unknown', 0.5, 1.0)])
+
+
+class DataTestCase(TestCase):
+
+    def setUp(self):
+        self.hasher = PasswordHasher(rounds=1000)
+
+    def tearDown(self):
+        pass
+
+    def make_acl(self):
+        return sql.SqlAcl(hasher=self.hasher)
+
+    def memberships(self, acl):
+        return sorted((login, filter_gn(acl.getUserGroups(acl.getUser(
+            login)))) for login in [u.login for u in acl.listUsers()])
+
+    def test_generate(self):
+        acl = self.make_acl()
+        counts = data.generate(acl, users=50, groups=5, roles=4,
+            groups_per_user=2, roles_per_group=2, chunk_size=20)
+        self.assertEqual(counts['user'], 50)
+        self.assertEqual(counts['group'], 5)
+        self.assertEqual(len(acl.listUsers()), 50)
+        self.assertEqual(len(acl.listGroups()), 5)
+        self.assertTrue(0 < counts['user_group'] <= 100)
+        self.assertTrue(0 < counts['group_role'] <= 10)
+        self.assertTrue(acl.validate('user0000000', 'password'))
+
+        other = self.make_acl()
+        data.generate(other, users=50, groups=5, roles=4,
+            groups_per_user=2, roles_per_group=2)
+        self.assertEqual(self.memberships(acl), self.memberships(other))
+
+    def test_picker(self):
+        rng = random.Random(0)
+        picker = data.Picker(range(100), rng, 'zipf')
+        picks = [picker.pick(3) for i in range(200)]
+        for p in picks:
+            self.assertEqual(len(set(p)), 3)
+        # the first item is picked far more often than the last.
+        flat = sum(picks, [])
+        self.assertTrue(flat.count(0) > flat.count(99) * 5)
+        self.assertEqual(sorted(picker.pick(200)), range(100))
+        self.assertRaises(ValueError, data.Picker, [], rng, 'normal')
+
+
+class ScalingTestCase(TestCase):
+
+    def setUp(self):
+        pass
+
+    def tearDown(self):
+        pass
+
+    def test_dataset_size(self):
+        self.assertEqual(scaling.dataset_size(100000), (100000, 5000, 500))
+        self.assertEqual(scaling.dataset_size(10), (10, 1, 1))
+
+    def test_exponents(self):
+        results = {
+            'users=10:a': {'p50': 1.0},
+            'users=100:a': {'p50': 10.0},
+            'users=10:b': {'p50': 1.0},
+            'users=100:b': {'p50': 1.0},
+        }
+        found = scaling.exponents(results, [10, 100])
+        self.assertAlmostEqual(found['a'][0], 1.0)
+        self.assertAlmostEqual(found['b'][0], 0.0)
+
+    def test_main(self):
+        status = scaling.main(['--size', '20', '--size', '40',
+            '--repeat', '2', '--warmup', '0', '--quiet',
+            '--output', os.devnull, '--max-exponent', '1000'])
+        self.assertEqual(status, 0)
+
+
+class LoadTestCase(TestCase):
+
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp()
+        os.close(fd)
+
+    def tearDown(self):
+        os.unlink(self.path)
+
+    def test_parse_mix(self):
+        self.assertEqual(loadgen.parse_mix('login=1,page=2.5,post'),
+            {'login': 1, 'page': 2.5, 'post': 1})
+        self.assertRaises(ValueError, loadgen.parse_mix,
+            'login=1,delete=1')
+
+    def test_run(self):
+        logins = loadgen.make_logins(2)
+        app = loadgen.make_app('sqlite:///' + self.path, logins)
+        results, errors, elapsed = loadgen.run(app, logins, threads=3,
+            requests=40)
+        self.assertEqual(sum(r['count'] for r in results.values()), 40)
+        self.assertEqual(sum(errors.values()), 0)
+        self.assertTrue(results['login']['count'] >= 3)
+        self.assertTrue(elapsed > 0)
+
+    def test_main(self):
+        status = loadgen.main(['--threads', '2', '--requests', '10',
+            '--users', '1', '--mix', 'page=1,post=1,logout=1', '--quiet',
+            '--output', self.path])
+        self.assertEqual(status, 0)
+        with open(self.path) as stream:
+            throughput = json.load(stream)['throughput']
+        self.assertEqual(sorted(throughput),
+            ['login', 'logout', 'page', 'post', 'total'])
+
+
+def test_suite():
+    suite = TestSuite()
+    suite.addTest(makeSuite(BenchTestCase))
+    suite.addTest(makeSuite(HotPathsTestCase))
+    suite.addTest(makeSuite(ParityTestCase))
+    suite.addTest(makeSuite(DataTestCase))
+    suite.addTest(makeSuite(ScalingTestCase))
+    suite.addTest(makeSuite(LoadTestCase))
+    return suite
+
+if __name__ == '__main__':
+    import unittest
+    unittest.main()
@@ -0,0 +1,78 @@
+from unittest import TestCase, TestSuite, makeSuite
+
+from mtj.flask.acl.cache import LRUCache
+
+
+class Timer(object):
+
+    def __init__(self, now=0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+class LRUCacheTestCase(TestCase):
+
+    def setUp(self):
+        self.timer = Timer()
+
+    def tearDown(self):
+        pass
+
+    def test_get_set(self):
+        cache = LRUCache()
+        self.assertEqual(cache.get('a'), None)
+        cache.set('a', 1)
+        self.assertEqual(cache.get('a'), 1)
+        self.assertEqual(cache.get('b', 2), 2)
+        self.assertEqual((cache.hits, cache.misses), (1, 2))
+
+    def test_maxsize(self):
+        cache = LRUCache(maxsize=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        # a is now the most recently used.
+        cache.get('a')
+        cache.set('c', 3)
+        self.assertEqual(len(cache), 2)
+        self.assertTrue('a' in cache)
+        self.assertFalse('b' in cache)
+        self.assertTrue('c' in cache)
+
+    def test_ttl(self):
+        cache = LRUCache(ttl=10, timer=self.timer)
+        cache.set('a', 1)
+        self.timer.now = 9
+        self.assertEqual(cache.get('a'), 1)
+        self.timer.now = 10
+        self.assertEqual(cache.get('a'), None)
+        self.assertEqual(len(cache), 0)
+
+    def test_default_ttl(self):
+        cache = LRUCache(timer=self.timer)
+        cache.set('a', 1)
+        self.timer.now = 59
+        self.assertEqual(cache.get('a'), 1)
+        self.timer.now = 60
+        self.assertEqual(cache.get('a'), None)
+
+    def test_discard(self):
+        cache = LRUCache()
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.discard('a', 'c')
+        self.assertEqual(cache.stats(), {
+            'hits': 0, 'misses': 0, 'size': 1, 'maxsize': 1024})
+        cache.clear()
+        self.assertEqual(len(cache), 0)
+
+
+def test_suite():
+    suite = TestSuite()
+    suite.addTest(makeSuite(LRUCacheTestCase))
+    return suite
+
+if __name__ == '__main__':
+    import unittest
+    unittest.main()
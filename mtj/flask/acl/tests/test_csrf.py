@@ -1,5 +1,6 @@
 from unittest import TestCase, TestSuite, makeSuite
-from flask import Flask, session, g
+from StringIO import StringIO
+from flask import Flask, Markup, request, session, g
 from werkzeug.exceptions import Forbidden
 
 from mtj.flask.acl.base import BaseUser, anonymous
@@ -44,6 +45,56 @@ class CsrfTestCase(TestCase):
         self.assertTrue(self.csrf.render('username').startswith(
             '<input type="hidden"'))
 
+    def test_cache(self):
+        self.csrf.getSecretFor('username')
+        self.csrf.getSecretFor('username')
+        self.assertEqual(self.csrf.cache.hits, 1)
+        self.assertEqual(self.csrf.cache.misses, 1)
+
+        # changing the secret does not use the previous entry.
+        self.csrf.secret = 'othersecret'
+        self.assertNotEqual(self.csrf.getSecretFor('username'),
+            '857c28b1c5f87bfe312fc7df185a782a6bb46cad')
+
+    def test_verify(self):
+        token = '857c28b1c5f87bfe312fc7df185a782a6bb46cad'
+        self.assertTrue(self.csrf.verify(token, 'username'))
+        self.assertTrue(self.csrf.verify(unicode(token), 'username'))
+        self.assertFalse(self.csrf.verify(token, 'other'))
+        self.assertFalse(self.csrf.verify(None, 'username'))
+        self.assertFalse(self.csrf.verify(u'\u2603', 'username'))
+
+    def test_window(self):
+        now = [1000]
+        auth = csrf.Authenticator(secret='foobartestsecret', window=100,
+            timer=lambda: now[0])
+        token = auth.getSecretFor('username')
+        self.assertNotEqual(token, '857c28b1c5f87bfe312fc7df185a782a6bb46cad')
+        self.assertTrue(auth.verify(token, 'username'))
+        self.assertTrue(auth.lazyInput('username').verify(token))
+
+        # still accepted in the next window.
+        now[0] = 1150
+        self.assertNotEqual(auth.getSecretFor('username'), token)
+        self.assertTrue(auth.verify(token, 'username'))
+        self.assertTrue(auth.lazyInput('username').verify(token))
+
+        now[0] = 1200
+        self.assertFalse(auth.verify(token, 'username'))
+        self.assertFalse(auth.lazyInput('username').verify(token))
+
+        # the secret of each window is only derived once.
+        self.assertEqual(auth.cache.misses, 3)
+
+    def test_lazy_input(self):
+        lazy = self.csrf.lazyInput('username')
+        self.assertEqual(len(self.csrf.cache), 0)
+        self.assertEqual(str(Markup(lazy)), self.csrf.render('username'))
+        self.assertTrue(lazy.verify(
+            '857c28b1c5f87bfe312fc7df185a782a6bb46cad'))
+        self.assertEqual(self.csrf.cache.misses, 1)
+        self.assertEqual(self.csrf.cache.hits, 1)
+
 
 class CsrfFlaskTestCase(TestCase):
     """
@@ -84,6 +135,35 @@ class CsrfFlaskTestCase(TestCase):
             # interfere with the wsgi stack.
             self.assertTrue(csrf_protect() is None)
 
+    def test_csrf_protect_header(self):
+        data = {'upload': (StringIO('x' * 4096), 'upload.txt')}
+        with self.app.test_request_context('/', method='POST', data=data,
+                headers={'X-CSRF-Token': 'bad'}):
+            g.mtj_user = BaseUser('username')
+            self.assertRaises(Forbidden, csrf_protect)
+            # the body was never parsed.
+            self.assertFalse('form' in request.__dict__)
+            self.assertFalse('files' in request.__dict__)
+
+        data = {'upload': (StringIO('x' * 4096), 'upload.txt')}
+        with self.app.test_request_context('/', method='POST', data=data,
+                headers={'X-CSRF-Token':
+                    '857c28b1c5f87bfe312fc7df185a782a6bb46cad'}):
+            g.mtj_user = BaseUser('username')
+            self.assertTrue(csrf_protect() is None)
+            self.assertFalse('form' in request.__dict__)
+            self.assertEqual(request.files['upload'].read(), 'x' * 4096)
+
+    def test_csrf_protect_lazy_input(self):
+        with self.app.test_request_context('/', method='GET'):
+            g.mtj_user = BaseUser('username')
+            self.assertTrue(csrf_protect() is None)
+            authenticator = self.app.config['MTJ_CSRF']
+            self.assertEqual(len(authenticator.cache), 0)
+            self.assertTrue(
+                '857c28b1c5f87bfe312fc7df185a782a6bb46cad' in
+                str(Markup(g.csrf_input)))
+
 
 def test_suite():
     suite = TestSuite()
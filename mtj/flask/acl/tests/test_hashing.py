@@ -0,0 +1,238 @@
+import pickle
+import threading
+from unittest import TestCase, TestSuite, makeSuite
+
+from mtj.flask.acl import sql
+from mtj.flask.acl.exc import HashTimeoutError
+from mtj.flask.acl.hashing import HashExecutor
+from mtj.flask.acl.hashing import PasswordHasher
+
+
+def add(a, b):
+    return a + b
+
+
+class HashExecutorTestCase(TestCase):
+
+    def setUp(self):
+        self.executor = None
+
+    def tearDown(self):
+        if self.executor is not None:
+            self.executor.close()
+
+    def test_run(self):
+        self.executor = HashExecutor(workers=2)
+        self.assertEqual(self.executor.run(add, 1, 2), 3)
+        self.assertEqual(self.executor.stats()['completed'], 1)
+        self.assertEqual(self.executor.stats()['pending'], 0)
+
+    def test_run_processes(self):
+        self.executor = HashExecutor(workers=2, processes=True)
+        self.assertEqual(self.executor.run(add, 1, 2), 3)
+
+    def test_error(self):
+        self.executor = HashExecutor(workers=1)
+        self.assertRaises(TypeError, self.executor.run, add, 1, None)
+        self.assertEqual(self.executor.stats()['pending'], 0)
+
+    def test_bounded(self):
+        self.executor = executor = HashExecutor(workers=1, max_pending=1,
+            timeout=0.05)
+        started = threading.Event()
+        release = threading.Event()
+
+        def block():
+            started.set()
+            release.wait()
+
+        t = threading.Thread(target=executor.run, args=(block,))
+        t.start()
+        started.wait()
+        try:
+            self.assertRaises(HashTimeoutError, executor.run, add, 1, 2)
+        finally:
+            release.set()
+            t.join()
+        self.assertEqual(executor.stats()['rejected'], 1)
+        self.assertEqual(executor.run(add, 1, 2), 3)
+
+
+class PasswordHasherTestCase(TestCase):
+
+    def setUp(self):
+        pass
+
+    def tearDown(self):
+        pass
+
+    def test_hash_verify(self):
+        hasher = PasswordHasher(rounds=2000)
+        password_hash = hasher.encrypt('password')
+        self.assertTrue(password_hash.startswith('$5$rounds=2000$'))
+        self.assertTrue(hasher.verify('password', password_hash))
+        self.assertFalse(hasher.verify('wrong', password_hash))
+        self.assertEqual(hasher.verify_and_update('password', password_hash),
+            (True, None))
+
+    def test_outdated(self):
+        old = PasswordHasher(rounds=2000).encrypt('password')
+        expensive = PasswordHasher(rounds=8000).encrypt('password')
+        hasher = PasswordHasher(schemes=('sha512_crypt', 'sha256_crypt'),
+            rounds=3000, min_rounds=2500, max_rounds=6000)
+        self.assertTrue(hasher.needs_update(old))
+        self.assertTrue(hasher.needs_update(expensive))
+
+        result, new_hash = hasher.verify_and_update('password', old)
+        self.assertTrue(result)
+        self.assertTrue(new_hash.startswith('$6$rounds=3000$'))
+        self.assertFalse(hasher.needs_update(new_hash))
+        self.assertEqual(hasher.verify_and_update('wrong', expensive),
+            (False, None))
+
+        hasher = PasswordHasher(min_rounds=2500, max_rounds=6000)
+        self.assertTrue(hasher.needs_update(old))
+        self.assertTrue(hasher.needs_update(expensive))
+
+    def test_calibrate(self):
+        hasher = PasswordHasher()
+        rounds = hasher.calibrate(target=0.005, samples=1,
+            sample_rounds=2000)
+        self.assertEqual(hasher.rounds, rounds)
+        self.assertEqual(hasher.max_rounds, rounds * 2)
+        self.assertTrue(hasher.encrypt('password').startswith(
+            '$5$rounds=%d$' % rounds))
+
+    def test_pickle(self):
+        hasher = pickle.loads(pickle.dumps(PasswordHasher(rounds=2000)))
+        self.assertTrue(hasher.encrypt('password').startswith(
+            '$5$rounds=2000$'))
+
+
+class SqlAclHasherTestCase(TestCase):
+
+    def setUp(self):
+        self.auth = sql.SqlAcl(hasher=PasswordHasher(rounds=2000))
+
+    def tearDown(self):
+        pass
+
+    def test_hasher(self):
+        auth = self.auth
+        auth.register('user', 'password')
+        self.assertTrue(auth.getUser('user').password.startswith(
+            '$5$rounds=2000$'))
+        auth.updatePassword('user', 'secret')
+        self.assertTrue(auth.getUser('user').password.startswith(
+            '$5$rounds=2000$'))
+
+    def test_default_hasher(self):
+        auth1 = sql.SqlAcl()
+        auth2 = sql.SqlAcl()
+        self.assertTrue(auth1.hasher is not auth2.hasher)
+
+    def test_rehash(self):
+        auth = self.auth
+        auth.register('user', 'password')
+        auth.hasher = PasswordHasher(rounds=3000, min_rounds=2500)
+        old_hash = auth.getUser('user').password
+
+        self.assertFalse(auth.validate('user', 'wrong'))
+        self.assertEqual(auth.getUser('user').password, old_hash)
+
+        self.assertTrue(auth.validate('user', 'password'))
+        new_hash = auth.getUser('user').password
+        self.assertTrue(new_hash.startswith('$5$rounds=3000$'))
+        self.assertTrue(auth.validate('user', 'password'))
+        self.assertEqual(auth.getUser('user').password, new_hash)
+
+
+class DummyHashTestCase(TestCase):
+    """
+    Validation of unknown users should verify against the dummy hash,
+    such that it takes as long as for known users; the timing itself
+    is measured by ``mtj.flask.acl.bench.parity``.
+    """
+
+    def setUp(self):
+        self.auth = sql.SqlAcl(hasher=PasswordHasher(rounds=2000))
+        self.auth.register('user', 'password')
+        self.verified = []
+        verify = self.auth._verify
+
+        def _verify(password, password_hash):
+            self.verified.append(password_hash)
+            return verify(password, password_hash)
+
+        self.auth._verify = _verify
+
+    def tearDown(self):
+        pass
+
+    def test_dummy_hash_verified(self):
+        hasher = self.auth.hasher
+        self.assertFalse(self.auth.validate('nouser', 'wrongpassword'))
+        self.assertEqual(self.verified, [hasher.dummy_hash])
+        self.assertFalse(self.auth.validate('user', 'wrongpassword'))
+        self.assertEqual(self.verified[1:],
+            [self.auth.getUser('user').password])
+
+    def test_dummy_hash(self):
+        hasher = self.auth.hasher
+        self.assertTrue(hasher.dummy_hash is hasher.dummy_hash)
+        self.assertTrue(hasher.dummy_hash.startswith('$5$rounds=2000$'))
+        self.assertFalse(self.auth.validate('nouser', ''))
+        self.assertFalse(self.auth.validate('nouser', None))
+        self.assertEqual(len(self.verified), 2)
+
+
+class SqlAclHashExecutorTestCase(TestCase):
+
+    def setUp(self):
+        self.executor = HashExecutor(workers=2)
+        self.auth = sql.SqlAcl(hash_executor=self.executor)
+
+    def tearDown(self):
+        self.executor.close()
+
+    def test_register_validate(self):
+        auth = self.auth
+        self.assertTrue(auth.register('user', 'password'))
+        self.assertFalse(auth.register('user', 'password'))
+        self.assertFalse(auth.register('short', 'short'))
+        self.assertTrue(auth.authenticate('user', 'password'))
+        self.assertFalse(auth.authenticate('user', 'wrong'))
+        self.assertFalse(auth.authenticate('nouser', 'password'))
+        self.assertTrue(auth.updatePassword('user', 'secret'))
+        self.assertTrue(auth.validate('user', 'secret'))
+        self.assertEqual(auth.registerMany([('user2', 'secret')]), ['user2'])
+        self.assertTrue(auth.validate('user2', 'secret'))
+        self.assertEqual(self.executor.stats()['completed'], 10)
+
+    def test_timeout(self):
+        auth = self.auth
+        auth.register('user', 'password')
+        self.executor.max_pending = 0
+        self.executor.timeout = 0
+        self.assertRaises(HashTimeoutError, auth.authenticate,
+            'user', 'password')
+        self.assertRaises(HashTimeoutError, auth.authenticate,
+            'nouser', 'password')
+        self.assertRaises(HashTimeoutError, auth.register,
+            'user2', 'password')
+        self.assertRaises(HashTimeoutError, auth.updatePassword,
+            'user', 'password')
+
+
+def test_suite():
+    suite = TestSuite()
+    suite.addTest(makeSuite(HashExecutorTestCase))
+    suite.addTest(makeSuite(PasswordHasherTestCase))
+    suite.addTest(makeSuite(SqlAclHasherTestCase))
+    suite.addTest(makeSuite(DummyHashTestCase))
+    suite.addTest(makeSuite(SqlAclHashExecutorTestCase))
+    return suite
+
+if __name__ == '__main__':
+    import unittest
+    unittest.main()
@@ -0,0 +1,183 @@
+import threading
+from unittest import TestCase, TestSuite, makeSuite
+
+from flask import Flask
+from flask.ext.principal import PermissionDenied
+
+from mtj.flask.acl import csrf
+from mtj.flask.acl import sql
+from mtj.flask.acl import user
+from mtj.flask.acl.cache import LRUCache
+from mtj.flask.acl.hooks import csrf_protect
+from mtj.flask.acl.metrics import Metrics
+from mtj.flask.acl.throttle import LoginThrottle
+
+
+class MetricsTestCase(TestCase):
+
+    def setUp(self):
+        self.metrics = Metrics(buckets=(0.1, 1))
+        self.app = Flask('mtj.flask.acl')
+
+    def tearDown(self):
+        pass
+
+    def test_threads(self):
+        metrics = self.metrics
+
+        def work():
+            for i in range(100):
+                metrics.inc('mtj_acl_login_total', outcome='success')
+                metrics.observe('mtj_acl_hash_verify_seconds', 0.5)
+
+        threads = [threading.Thread(target=work) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        counters, histograms = metrics.values()
+        self.assertEqual(counters[
+            ('mtj_acl_login_total', (('outcome', 'success'),))], 400)
+        self.assertEqual(histograms[('mtj_acl_hash_verify_seconds', ())],
+            [0, 400, 0, 200.0])
+
+    def test_short_lived_threads(self):
+        metrics = self.metrics
+
+        def work():
+            metrics.inc('mtj_acl_login_total', outcome='success')
+
+        # i.e. a thread per request server.
+        for i in range(200):
+            thread = threading.Thread(target=work)
+            thread.start()
+            thread.join()
+
+        counters, histograms = metrics.values()
+        self.assertEqual(counters, {
+            ('mtj_acl_login_total', (('outcome', 'success'),)): 200})
+        self.assertEqual(len(metrics._counters), 1)
+
+    def test_render(self):
+        metrics = self.metrics
+        metrics.inc('mtj_acl_login_total', outcome='failure')
+        metrics.inc('mtj_acl_login_total', 2, outcome='success')
+        metrics.observe('mtj_acl_hash_verify_seconds', 0.1)
+        metrics.observe('mtj_acl_hash_verify_seconds', 0.5)
+        metrics.observe('mtj_acl_hash_verify_seconds', 5)
+        metrics.observe('mtj_acl_request_overhead_seconds', 0.5,
+            endpoint='a"b')
+        with self.app.app_context():
+            result = metrics.render()
+        self.assertEqual(result.splitlines(), [
+            '# HELP mtj_acl_hash_verify_seconds '
+                'Time taken to verify a password hash.',
+            '# TYPE mtj_acl_hash_verify_seconds histogram',
+            'mtj_acl_hash_verify_seconds_bucket{le="0.1"} 1',
+            'mtj_acl_hash_verify_seconds_bucket{le="1.0"} 2',
+            'mtj_acl_hash_verify_seconds_bucket{le="+Inf"} 3',
+            'mtj_acl_hash_verify_seconds_sum 5.6',
+            'mtj_acl_hash_verify_seconds_count 3',
+            '# HELP mtj_acl_login_total Login attempts by outcome.',
+            '# TYPE mtj_acl_login_total counter',
+            'mtj_acl_login_total{outcome="failure"} 1',
+            'mtj_acl_login_total{outcome="success"} 2',
+            '# HELP mtj_acl_request_overhead_seconds '
+                'Time spent in the ACL per request by endpoint.',
+            '# TYPE mtj_acl_request_overhead_seconds histogram',
+            'mtj_acl_request_overhead_seconds_bucket'
+                '{endpoint="a\\"b",le="0.1"} 0',
+            'mtj_acl_request_overhead_seconds_bucket'
+                '{endpoint="a\\"b",le="1.0"} 1',
+            'mtj_acl_request_overhead_seconds_bucket'
+                '{endpoint="a\\"b",le="+Inf"} 1',
+            'mtj_acl_request_overhead_seconds_sum{endpoint="a\\"b"} 0.5',
+            'mtj_acl_request_overhead_seconds_count{endpoint="a\\"b"} 1',
+        ])
+
+
+class MetricsIntegrationTestCase(TestCase):
+
+    def setUp(self):
+        self.auth = sql.SqlAcl(setup_login='admin', setup_password='password',
+            cache=LRUCache())
+        self.metrics = Metrics()
+
+        app = Flask('mtj.flask.acl')
+        self.auth(app, permission_denied_handler=None)
+        app.config['SECRET_KEY'] = 'test_secret_key'
+        app.config['TESTING'] = True
+        app.config['MTJ_CSRF'] = csrf.Authenticator()
+        app.config['MTJ_THROTTLE'] = LoginThrottle()
+        app.before_request(csrf_protect)
+        app.register_blueprint(user.make_acl_front(metrics=self.metrics),
+            url_prefix='/acl')
+        self.app = app
+
+    def tearDown(self):
+        pass
+
+    def test_not_installed(self):
+        app = Flask('mtj.flask.acl')
+        app.register_blueprint(user.make_acl_front(), url_prefix='/acl')
+        self.assertFalse('MTJ_METRICS' in app.config)
+        with app.test_client() as c:
+            self.assertEqual(c.get('/acl/metrics').status_code, 404)
+
+    def test_metrics_access(self):
+        with self.app.test_client() as c:
+            self.assertRaises(PermissionDenied, c.get, '/acl/metrics')
+
+        self.app.config['MTJ_METRICS_TOKEN'] = 'scraper'
+        with self.app.test_client() as c:
+            self.assertRaises(PermissionDenied, c.get, '/acl/metrics',
+                headers={'Authorization': 'Bearer nope'})
+            rv = c.get('/acl/metrics',
+                headers={'Authorization': 'Bearer scraper'})
+            self.assertEqual(rv.status_code, 200)
+
+    def test_metrics(self):
+        self.assertTrue(self.app.config['MTJ_METRICS'] is self.metrics)
+        with self.app.test_client() as c:
+            c.post('/acl/login', data={'login': 'admin', 'password': 'bad'})
+            c.post('/acl/login', data={'login': 'admin',
+                'password': 'password'})
+            c.get('/acl/current')
+            rv = c.post('/acl/edit/admin', data={'name': 'Admin'})
+            self.assertEqual(rv.status_code, 403)
+
+            rv = c.get('/acl/metrics')
+            self.assertEqual(rv.status_code, 200)
+            self.assertTrue(rv.headers['Content-Type'].startswith(
+                'text/plain; version=0.0.4'))
+
+        lines = rv.data.splitlines()
+        for line in [
+                'mtj_acl_login_total{outcome="failure"} 1',
+                'mtj_acl_login_total{outcome="success"} 1',
+                'mtj_acl_hash_verify_seconds_count 2',
+                'mtj_acl_token_validations_total{result="valid"} 4',
+                'mtj_acl_csrf_rejections_total 1',
+                'mtj_acl_login_throttled_total 0',
+                'mtj_acl_rejected_inputs_total 0',
+                'mtj_acl_cache_size{cache="csrf"} 1',
+                'mtj_acl_request_overhead_seconds_count'
+                    '{endpoint="acl_front.current"} 1',
+                ]:
+            self.assertTrue(line in lines, line)
+        self.assertTrue(any(line.startswith(
+            'mtj_acl_cache_hits_total{cache="acl"} ') for line in lines))
+        self.assertTrue(any(line.startswith(
+            'mtj_acl_role_resolution_seconds_count ') for line in lines))
+
+
+def test_suite():
+    suite = TestSuite()
+    suite.addTest(makeSuite(MetricsTestCase))
+    suite.addTest(makeSuite(MetricsIntegrationTestCase))
+    return suite
+
+if __name__ == '__main__':
+    import unittest
+    unittest.main()
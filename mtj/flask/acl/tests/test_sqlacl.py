@@ -1,11 +1,18 @@
+import os
+import sys
+import tempfile
 from unittest import TestCase, TestSuite, makeSuite
 
-from flask import Flask, session
+from flask import Flask, request, session
 from flask.ext.principal import PermissionDenied
+import sqlalchemy.exc
 
 from mtj.flask.acl import sql
 from mtj.flask.acl import flask
 from mtj.flask.acl import user
+from mtj.flask.acl.cache import LRUCache
+from mtj.flask.acl.exc import InputTooLongError
+from mtj.flask.acl.hashing import HashExecutor
 
 def filter_gn(groups):
     results = [ug.name for ug in groups]
@@ -35,6 +42,21 @@ class AclTestCase(TestCase):
         self.assertFalse(self.auth.register('admin', ''))
         self.assertFalse(self.auth.register('admin', '1'))
 
+    def test_too_long_input(self):
+        auth = sql.SqlAcl(max_login_length=8, max_password_length=16)
+        self.assertTrue(auth.register('admin', 'password'))
+        self.assertRaises(InputTooLongError,
+            auth.register, 'administrator', 'password')
+        self.assertRaises(InputTooLongError,
+            auth.register, 'user', 'password' * 3)
+        self.assertRaises(InputTooLongError,
+            auth.validate, 'admin', 'password' * 3)
+        self.assertRaises(InputTooLongError,
+            auth.updatePassword, 'admin', 'password' * 3)
+        self.assertEqual(auth.registerMany([('user', 'password' * 3)]), [])
+        self.assertEqual(auth.rejected_inputs, 5)
+        self.assertTrue(auth.validate('admin', 'password'))
+
     def test_list_users(self):
         auth = self.auth
         auth.register('admin', 'password')
@@ -48,6 +70,71 @@ class AclTestCase(TestCase):
         self.assertEqual(auth.getUser('admin').login, 'admin')
         self.assertEqual(auth.getUser('user').login, 'user')
 
+    def test_list_users_keyset(self):
+        auth = self.auth
+        auth.registerMany([('user%d' % i, 'secret') for i in range(5)])
+
+        def logins(users):
+            return [u.login for u in users]
+
+        self.assertEqual(logins(auth.listUsers(limit=2)), ['user0', 'user1'])
+        self.assertEqual(logins(auth.listUsers(after='user1', limit=2)),
+            ['user2', 'user3'])
+        self.assertEqual(logins(auth.listUsers(after='user3')),
+            ['user4'])
+        self.assertEqual(logins(auth.listUsers(before='user3', limit=2)),
+            ['user1', 'user2'])
+        self.assertEqual(logins(auth.listUsers(before='user1')),
+            ['user0'])
+
+        auth.addGroups(['b', 'a', 'c'])
+        self.assertEqual([g.name for g in auth.listGroups(after='a')],
+            ['b', 'c'])
+        self.assertEqual([g.name for g in auth.listGroups(before='c',
+            limit=1)], ['b'])
+
+    def test_search_users(self):
+        auth = self.auth
+        auth.registerMany([
+            ('alice', 'secret', 'Alice', 'alice@example.com'),
+            ('bob', 'secret', 'Bob', 'bob@example.com'),
+            ('carol', 'secret', 'Carol', 'bob.carol@example.net'),
+            ('dave', 'secret', None, None),
+        ])
+
+        def search(query, limit=50):
+            return [u.login for u in auth.searchUsers(query, limit)]
+
+        self.assertEqual(search('al'), ['alice'])
+        self.assertEqual(search('Bob'), ['bob'])
+        self.assertEqual(search('bob'), ['bob', 'carol'])
+        self.assertEqual(search('bob', limit=1), ['bob'])
+        self.assertEqual(search('d'), ['dave'])
+        self.assertEqual(search('e'), [])
+        self.assertEqual(search(''), [])
+
+    def test_search_users_non_ascii(self):
+        auth = self.auth
+        top = unichr(sys.maxunicode)
+        auth.registerMany([
+            (u'caf\xe9', 'secret'),
+            (u'caf\xe9s', 'secret'),
+            (u'caf\xea', 'secret'),
+            (u'x' + top, 'secret'),
+            (u'x' + top + u'a', 'secret'),
+            (u'y', 'secret'),
+        ])
+
+        def search(query):
+            return [u.login for u in auth.searchUsers(query)]
+
+        self.assertEqual(search(u'caf\xe9'), [u'caf\xe9', u'caf\xe9s'])
+        self.assertEqual(search(u'caf\xe9'.encode('utf8')),
+            [u'caf\xe9', u'caf\xe9s'])
+        self.assertEqual(search('caf\xe9'), [])
+        self.assertEqual(search(u'x' + top), [u'x' + top, u'x' + top + u'a'])
+        self.assertEqual(search(top), [])
+
     def test_edit_user(self):
         auth = self.auth
         auth.register('user', 'password')
@@ -99,6 +186,18 @@ class AclTestCase(TestCase):
         self.assertEqual(auth.getGroup('user').description, 'Normal users')
         self.assertEqual(auth.getGroup('dummy'), None)
 
+    def test_failed_write_rolled_back(self):
+        auth = self.auth
+        auth.register('admin', 'password')
+        auth.addGroup('g1')
+        self.assertRaises(sqlalchemy.exc.IntegrityError, auth.addGroup, 'g1')
+
+        # the session of this thread remains usable.
+        self.assertEqual([g.name for g in auth.listGroups()], ['g1'])
+        self.assertEqual([u.login for u in auth.listUsers()], ['admin'])
+        auth.addGroup('g2')
+        self.assertEqual(auth.getGroup('g2').name, 'g2')
+
     def test_user_group(self):
         auth = self.auth
         auth.register('admin', 'password')
@@ -178,6 +277,80 @@ class AclTestCase(TestCase):
         flask._roles.remove('__test1')
         flask._roles.remove('__test2')
 
+    def test_load_principal(self):
+        flask._roles.add('__test1')
+        auth = self.auth
+        auth.addGroup('user')
+        auth.addGroup('nimda')
+        auth.register('user1', 'secret')
+        auth.register('user2', 'secret')
+        auth.setGroupRoles(auth.getGroup('user'), ('__test1',))
+        auth.setGroupRoles(auth.getGroup('nimda'), ('admin', '__test1'))
+        auth.setUserGroups(auth.getUser('user1'), ('user', 'nimda'))
+
+        user, group_names, roles = auth.loadPrincipal('user1')
+        self.assertEqual(user.login, 'user1')
+        self.assertEqual(group_names, ['nimda', 'user'])
+        self.assertEqual(roles, {'admin', '__test1'})
+
+        user, group_names, roles = auth.loadPrincipal('user2')
+        self.assertEqual(user.login, 'user2')
+        self.assertEqual(group_names, [])
+        self.assertEqual(roles, set())
+
+        self.assertEqual(auth.loadPrincipal('user3'), (None, [], set()))
+        flask._roles.remove('__test1')
+
+    def test_register_many(self):
+        auth = self.auth
+        auth.register('user1', 'secret')
+        result = auth.registerMany([
+            {'login': 'user1', 'password': 'secret'},
+            {'login': 'user2', 'password': 'secret', 'name': 'User 2'},
+            ('user3', 'secret', 'User 3', 'user3@example.com'),
+            ('user4', 'short'),
+            ('user2', 'secret'),
+        ])
+        self.assertEqual(result, ['user2', 'user3'])
+        self.assertEqual([u.login for u in auth.listUsers()],
+            ['user1', 'user2', 'user3'])
+        self.assertEqual(auth.getUser('user2').name, 'User 2')
+        self.assertEqual(auth.getUser('user3').email, 'user3@example.com')
+        self.assertTrue(auth.validate('user3', 'secret'))
+
+    def test_add_groups(self):
+        auth = self.auth
+        auth.addGroup('user')
+        result = auth.addGroups(['user', 'admin', ('nimda', 'Nimda'),
+            'admin'])
+        self.assertEqual(result, ['admin', 'nimda'])
+        self.assertEqual(auth.getGroup('nimda').description, 'Nimda')
+        self.assertEqual(len(auth.listGroups()), 3)
+
+    def test_set_user_groups_many(self):
+        auth = self.auth
+        auth.registerMany([('user1', 'secret'), ('user2', 'secret'),
+            ('user3', 'secret')])
+        auth.addGroups(['user', 'admin'])
+        auth.setUserGroups(auth.getUser('user3'), ('user',))
+
+        auth.setUserGroupsMany({
+            'user1': ('user', 'admin'),
+            'user2': ('user', 'nimda'),
+        })
+        self.assertEqual(filter_gn(auth.getUserGroups(auth.getUser('user1'))),
+            ('admin', 'user'))
+        self.assertEqual(filter_gn(auth.getUserGroups(auth.getUser('user2'))),
+            ('user',))
+        self.assertEqual(filter_gn(auth.getUserGroups(auth.getUser('user3'))),
+            ('user',))
+
+        auth.setUserGroupsMany({'user1': (), 'user3': ('admin',)})
+        self.assertEqual(filter_gn(auth.getUserGroups(auth.getUser('user1'))),
+            ())
+        self.assertEqual(filter_gn(auth.getUserGroups(auth.getUser('user3'))),
+            ('admin',))
+
     def test_setup_login(self):
         auth = sql.SqlAcl(setup_login='admin')
         self.assertEqual(auth.getUser('admin'), None)
@@ -198,6 +371,242 @@ class AclTestCase(TestCase):
         self.assertEqual(len(auth.getUserGroups(auth.getUser('admin'))), 0)
 
 
+class CachedAclTestCase(TestCase):
+
+    def setUp(self):
+        self.cache = LRUCache()
+        self.auth = sql.SqlAcl(cache=self.cache)
+        self.auth.register('user1', 'secret')
+        self.auth.register('user2', 'secret')
+        self.auth.addGroup('user')
+        self.auth.addGroup('nimda')
+        flask._roles.add('__test1')
+
+    def tearDown(self):
+        flask._roles.remove('__test1')
+
+    def test_user_cached(self):
+        auth = self.auth
+        self.assertTrue(auth.getUser('user1') is auth.getUser('user1'))
+        self.assertEqual(self.cache.hits, 1)
+        # misses are not cached.
+        self.assertEqual(auth.getUser('user3'), None)
+        auth.register('user3', 'secret')
+        self.assertEqual(auth.getUser('user3').login, 'user3')
+
+    def test_edit_user_invalidates(self):
+        auth = self.auth
+        auth.getUser('user1')
+        auth.getUser('user2')
+        auth.editUser('user1', 'User Name', 'user@example.com')
+        self.assertEqual(auth.getUser('user1').name, 'User Name')
+        self.assertTrue(('user', 'user2') in self.cache)
+
+        auth.updatePassword('user1', 'password')
+        self.assertFalse(('user', 'user1') in self.cache)
+        self.assertTrue(auth.validate('user1', 'password'))
+
+    def test_user_groups_invalidates(self):
+        auth = self.auth
+        user1 = auth.getUser('user1')
+        user2 = auth.getUser('user2')
+        group_user = auth.getGroup('user')
+        auth.setGroupRoles(group_user, ('__test1',))
+
+        self.assertEqual(auth.getUserGroups(user1), [])
+        self.assertEqual(auth.getUserRoles(user1), set())
+        self.assertEqual(auth.getUserRoles(user2), set())
+        auth.setUserGroups(user1, ('user',))
+        self.assertEqual(filter_gn(auth.getUserGroups(user1)), ('user',))
+        self.assertEqual(auth.getUserRoles(user1), {'__test1'})
+        self.assertTrue(('user_roles', 'user2') in self.cache)
+
+        auth.editGroup('user', 'Users')
+        self.assertEqual(auth.getUserGroups(user1)[0].description, 'Users')
+
+    def test_group_roles_invalidates(self):
+        auth = self.auth
+        user1 = auth.getUser('user1')
+        user2 = auth.getUser('user2')
+        group_user = auth.getGroup('user')
+        auth.setUserGroups(user1, ('user',))
+        auth.setUserGroups(user2, ('nimda',))
+
+        self.assertEqual(auth.getGroupRoles(group_user), set())
+        self.assertEqual(auth.getUserRoles(user1), set())
+        self.assertEqual(auth.getUserRoles(user2), set())
+        auth.setGroupRoles(group_user, ('__test1',))
+        self.assertEqual(auth.getGroupRoles(group_user), {'__test1'})
+        self.assertEqual(auth.getUserRoles(user1), {'__test1'})
+        self.assertTrue(('user_roles', 'user2') in self.cache)
+
+        # modifying the result does not modify the cached value.
+        auth.getGroupRoles(group_user).add('admin')
+        self.assertEqual(auth.getGroupRoles(group_user), {'__test1'})
+
+
+class Timer(object):
+
+    def __init__(self, now=0):
+        self.now = now
+
+    def __call__(self):
+        self.now += 1
+        return self.now
+
+
+class SharedCachedAclTestCase(TestCase):
+    """
+    Cached acls of separate processes sharing a database.
+    """
+
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp()
+        os.close(fd)
+        self.src = 'sqlite:///' + self.path
+        self.timer = Timer()
+        self.auth1 = sql.SqlAcl(self.src, cache=LRUCache(timer=self.timer))
+        self.auth2 = sql.SqlAcl(self.src, cache=LRUCache(timer=self.timer))
+        self.auth1.register('user', 'password')
+
+    def tearDown(self):
+        os.unlink(self.path)
+
+    def test_password_not_cached(self):
+        self.assertTrue(self.auth2.validate('user', 'password'))
+        self.auth1.updatePassword('user', 'secret')
+        self.assertFalse(self.auth2.validate('user', 'password'))
+        self.assertTrue(self.auth2.validate('user', 'secret'))
+
+    def test_groups_expire(self):
+        self.auth1.addGroup('admin')
+        user = self.auth2.getUser('user')
+        self.assertEqual(self.auth2.getUserGroups(user), [])
+        self.auth1.setUserGroups(user, ['admin'])
+        self.assertEqual(filter_gn(self.auth1.getUserGroups(user)),
+            ('admin',))
+        self.timer.now += 60
+        self.assertEqual(filter_gn(self.auth2.getUserGroups(user)),
+            ('admin',))
+
+
+class SqlTokenStoreTestCase(TestCase):
+
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp()
+        os.close(fd)
+        self.src = 'sqlite:///' + self.path
+        self.timer = Timer()
+
+    def tearDown(self):
+        os.unlink(self.path)
+
+    def test_shared(self):
+        auth1 = sql.SqlAcl(self.src, token_store=sql.SqlTokenStore())
+        auth2 = sql.SqlAcl(self.src, token_store=sql.SqlTokenStore())
+        auth3 = sql.SqlAcl(self.src)
+        token = auth1.generateAccessToken('user')
+        self.assertTrue(auth1.validateAccessToken(token))
+        self.assertTrue(auth2.validateAccessToken(token))
+        self.assertFalse(auth3.validateAccessToken(token))
+
+        auth2.revokeAccessToken(token)
+        self.assertFalse(auth1.validateAccessToken(token))
+
+    def test_table(self):
+        from sqlalchemy import create_engine
+        engine = create_engine(self.src)
+        sql.SqlAcl(self.src)
+        self.assertFalse(engine.has_table('access_token'))
+
+        engine.execute('CREATE TABLE access_token (id INTEGER PRIMARY KEY, '
+            'login VARCHAR(255), token VARCHAR(64), issued FLOAT, '
+            'expires FLOAT)')
+        sql.SqlAcl(self.src, token_store=sql.SqlTokenStore())
+        rows = engine.execute('EXPLAIN QUERY PLAN SELECT id FROM '
+            'access_token WHERE login = "a" AND token = "b"').fetchall()
+        self.assertTrue('ix_access_token_login_token' in str(rows))
+
+    def test_bad_token(self):
+        auth = sql.SqlAcl(self.src, token_store=sql.SqlTokenStore())
+        self.assertFalse(auth.validateAccessToken({}))
+        self.assertFalse(auth.validateAccessToken({'login': 'user'}))
+        self.assertFalse(auth.validateAccessToken(
+            {'login': 'user', 'ts': 'bad'}))
+
+    def test_max_tokens_ttl(self):
+        store = sql.SqlTokenStore(max_tokens=2, ttl=10, timer=self.timer)
+        auth = sql.SqlAcl(self.src, token_store=store)
+        t1 = store.issue('user')
+        t2 = store.issue('user')
+        t3 = store.issue('user')
+        self.assertFalse(store.validate(t1))
+        self.assertTrue(store.validate(t2))
+        self.assertTrue(store.validate(t3))
+        self.timer.now += 10
+        self.assertFalse(store.validate(t3))
+
+    def test_sweep(self):
+        store = sql.SqlTokenStore(ttl=10, sweep_interval=100, batch_size=2,
+            timer=self.timer)
+        auth = sql.SqlAcl(self.src, token_store=store)
+        for i in range(5):
+            store.issue('user%d' % i)
+        self.timer.now += 50
+        self.assertEqual(len(store.logins()), 5)
+        self.timer.now += 50
+        # issuing triggers the sweep of all expired tokens.
+        token = store.issue('user')
+        self.assertEqual(store.logins(), ['user'])
+
+
+class SessionTestCase(TestCase):
+
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp()
+        os.close(fd)
+        self.src = 'sqlite:///' + self.path
+
+    def tearDown(self):
+        os.unlink(self.path)
+
+    def test_session_reuse(self):
+        auth = sql.SqlAcl(self.src)
+        session = auth.session()
+        self.assertTrue(session is auth.session())
+        auth.removeSession()
+        self.assertFalse(session is auth.session())
+
+    def test_session_app_teardown(self):
+        auth = sql.SqlAcl(self.src)
+        app = Flask('mtj.flask.acl')
+        auth(app, permission_denied_handler=None)
+        with app.app_context():
+            session = auth.session()
+            auth.register('user', 'password')
+            self.assertTrue(session is auth.session())
+        self.assertFalse(session is auth.session())
+        self.assertEqual(auth.getUser('user').login, 'user')
+
+    def test_create_indexes(self):
+        from sqlalchemy import create_engine
+        engine = create_engine(self.src)
+        engine.execute('CREATE TABLE user (login VARCHAR(255) PRIMARY KEY, '
+            'password VARCHAR(255), name VARCHAR(255), email VARCHAR(255))')
+        auth = sql.SqlAcl(self.src)
+        rows = engine.execute('EXPLAIN QUERY PLAN SELECT login FROM user '
+            'WHERE email >= "a" AND email < "b"').fetchall()
+        self.assertTrue('ix_user_email' in str(rows))
+
+    def test_pool_options(self):
+        from sqlalchemy.pool import QueuePool
+        auth = sql.SqlAcl(self.src, poolclass=QueuePool, pool_size=2,
+            max_overflow=0)
+        self.assertEqual(auth._conn.pool.size(), 2)
+        auth.register('user', 'password')
+        self.assertEqual(auth.getUser('user').login, 'user')
+
+
 class UserSqlAclIntegrationTestCase(TestCase):
 
     def setUp(self):
@@ -222,6 +631,59 @@ class UserSqlAclIntegrationTestCase(TestCase):
             rv = c.get('/acl/list')
             self.assertTrue('<td>admin</td>' in rv.data)
 
+    def test_list_user_pages(self):
+        self.app.config['MTJ_ACL_PAGE_SIZE'] = 2
+        self.auth.registerMany([('user%d' % i, 'secret') for i in range(4)])
+
+        with self.client as c:
+            rv = c.get('/acl/list')
+            self.assertTrue('<td>admin</td>' in rv.data)
+            self.assertTrue('<td>user0</td>' in rv.data)
+            self.assertFalse('<td>user1</td>' in rv.data)
+            self.assertFalse('list?before=' in rv.data)
+            self.assertTrue('href="list?after=user0"' in rv.data)
+
+            rv = c.get('/acl/list?after=user2')
+            self.assertTrue('<td>user3</td>' in rv.data)
+            self.assertTrue('href="list?before=user3"' in rv.data)
+            self.assertFalse('list?after=' in rv.data)
+
+            rv = c.get('/acl/list?before=user3')
+            self.assertTrue('<td>user1</td>' in rv.data)
+            self.assertTrue('<td>user2</td>' in rv.data)
+            self.assertTrue('href="list?before=user1"' in rv.data)
+            self.assertTrue('href="list?after=user2"' in rv.data)
+
+    def test_search_user(self):
+        self.auth.registerMany([('user1', 'secret', 'someone'),
+            ('user2', 'secret', None, 'some@example.com')])
+        with self.client as c:
+            rv = c.get('/acl/list?q=some')
+            self.assertTrue('name="q" value="some"' in rv.data)
+            self.assertTrue('<td>user1</td>' in rv.data)
+            self.assertTrue('<td>user2</td>' in rv.data)
+            self.assertFalse('<td>admin</td>' in rv.data)
+
+    def test_principal_single_query(self):
+        from sqlalchemy import event
+        statements = []
+        def count(conn, cursor, statement, *a):
+            statements.append(statement)
+
+        @self.app.route('/principal')
+        def principal():
+            flask.verifyUserRole('admin')
+            return ','.join(flask.getCurrentUserGroupNames())
+
+        event.listen(self.auth._conn, 'before_cursor_execute', count)
+        try:
+            with self.client as c:
+                rv = c.get('/principal')
+        finally:
+            event.remove(self.auth._conn, 'before_cursor_execute', count)
+        self.assertEqual(rv.data, 'admin')
+        self.assertEqual(len(statements), 1)
+
     def test_add_user(self):
         with self.client as c:
             rv = c.get('/acl/add')
@@ -299,6 +761,64 @@ class UserSqlAclIntegrationTestCase(TestCase):
                 'confirm_password': '123456'})
             self.assertTrue(self.auth.validate('admin', '123456'))
 
+    def test_hash_busy(self):
+        self.auth.hash_executor = HashExecutor(max_pending=0, timeout=0)
+        with self.app.test_client() as c:
+            rv = c.post('/acl/login',
+                data={'login': 'admin', 'password': 'password'})
+            self.assertTrue('Server is busy' in rv.data)
+
+        with self.client as c:
+            rv = c.post('/acl/passwd', data={
+                'old_password': 'password', 'password': '123456',
+                'confirm_password': '123456'})
+            self.assertTrue('Server is busy' in rv.data)
+        self.auth.hash_executor = None
+        self.assertTrue(self.auth.validate('admin', 'password'))
+
+    def test_input_too_long(self):
+        self.auth.max_password_length = 16
+        self.auth.max_form_size = 1024
+        with self.app.test_client() as c:
+            rv = c.post('/acl/login',
+                data={'login': 'admin', 'password': 'password' * 3})
+            self.assertTrue('Login or password too long.' in rv.data)
+
+            rv = c.post('/acl/login',
+                data={'login': 'admin', 'password': 'password' * 200})
+            self.assertEqual(rv.status_code, 413)
+
+        with self.client as c:
+            rv = c.post('/acl/passwd', data={
+                'old_password': 'password', 'password': 'password' * 3,
+                'confirm_password': 'password' * 3})
+            self.assertTrue('Password too long.' in rv.data)
+
+            rv = c.post('/acl/add', data={
+                'login': 'test_user', 'password': 'password' * 3})
+            self.assertTrue('Login or password too long.' in rv.data)
+
+        self.assertEqual(self.auth.rejected_inputs, 4)
+        self.assertTrue(self.auth.validate('admin', 'password'))
+
+    def test_form_size_acl_only(self):
+        self.auth.max_form_size = 1024
+
+        @self.app.route('/upload', methods=['POST'])
+        def upload():
+            return str(len(request.form.get('data', '')))
+
+        with self.app.test_client() as c:
+            # unknown length, i.e. chunked.
+            rv = c.post('/acl/login', data={'login': 'admin',
+                'password': 'password'}, environ_overrides={
+                    'CONTENT_LENGTH': '', 'wsgi.input_terminated': True})
+            self.assertEqual(rv.status_code, 411)
+
+            # other routes of the app are not limited.
+            rv = c.post('/upload', data={'data': 'x' * 200000})
+            self.assertEqual(rv.data, '200000')
+
     def test_passwd_other(self):
         self.auth.register('test_user', 'password')
 
@@ -449,10 +969,23 @@ class UserSqlAclIntegrationTestCase(TestCase):
             self.assertTrue('<td>user</td>' in rv.data)
             self.assertTrue('<td>reviewer</td>' in rv.data)
 
+        self.app.config['MTJ_ACL_PAGE_SIZE'] = 2
+        with self.client as c:
+            rv = c.get('/acl/group/list')
+            self.assertTrue('<td>reviewer</td>' in rv.data)
+            self.assertFalse('<td>user</td>' in rv.data)
+            self.assertTrue('href="list?after=reviewer"' in rv.data)
+            rv = c.get('/acl/group/list?after=reviewer')
+            self.assertTrue('<td>user</td>' in rv.data)
+
 
 def test_suite():
     suite = TestSuite()
     suite.addTest(makeSuite(AclTestCase))
+    suite.addTest(makeSuite(CachedAclTestCase))
+    suite.addTest(makeSuite(SharedCachedAclTestCase))
+    suite.addTest(makeSuite(SqlTokenStoreTestCase))
+    suite.addTest(makeSuite(SessionTestCase))
     suite.addTest(makeSuite(UserSqlAclIntegrationTestCase))
     return suite
 
@@ -0,0 +1,196 @@
+import threading
+from unittest import TestCase, TestSuite, makeSuite
+
+from flask import Flask
+
+from mtj.flask.acl.base import SetupAcl
+from mtj.flask.acl.throttle import LoginThrottle
+from mtj.flask.acl.throttle import MemoryThrottleBackend
+from mtj.flask.acl import user
+
+
+class Timer(object):
+
+    def __init__(self, now=0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+class MemoryThrottleBackendTestCase(TestCase):
+
+    def setUp(self):
+        self.backend = MemoryThrottleBackend(window=100, buckets=10)
+
+    def tearDown(self):
+        pass
+
+    def test_sliding_window(self):
+        backend = self.backend
+        self.assertEqual(backend.hit('a', 0), 1)
+        self.assertEqual(backend.hit('a', 5), 2)
+        self.assertEqual(backend.hit('a', 50), 3)
+        self.assertEqual(backend.count('a', 99), 3)
+        # first bucket expired.
+        self.assertEqual(backend.count('a', 100), 1)
+        self.assertEqual(backend.hit('a', 120), 2)
+        self.assertEqual(backend.count('a', 150), 1)
+        self.assertEqual(backend.count('a', 1000), 0)
+        self.assertEqual(backend.count('b', 0), 0)
+
+    def test_reset(self):
+        backend = self.backend
+        backend.hit('a', 0)
+        backend.setBlock('a', 10, 1)
+        self.assertEqual(backend.getBlock('a'), (10, 1))
+        backend.reset('a')
+        self.assertEqual(backend.count('a', 0), 0)
+        self.assertEqual(backend.getBlock('a'), None)
+
+    def test_max_keys(self):
+        backend = MemoryThrottleBackend(window=100, buckets=10, max_keys=2)
+        backend.hit('a', 0)
+        backend.setBlock('a', 10, 1)
+        backend.hit('b', 50)
+        backend.hit('c', 100)
+        self.assertEqual(sorted(backend._counts.keys()), ['b', 'c'])
+        self.assertEqual(backend.getBlock('a'), None)
+
+    def test_max_keys_bounded(self):
+        backend = MemoryThrottleBackend(window=100, buckets=10, max_keys=10)
+        for i in range(100):
+            # all live within the window.
+            backend.hit('key%d' % i, 0)
+            backend.setBlock('key%d' % i, 50, 1)
+        backend.hit('key90', 1)
+        backend.hit('new', 1)
+        self.assertEqual(len(backend._counts), 10)
+        self.assertEqual(len(backend._blocks), 10)
+        # the least recently hit were evicted.
+        self.assertEqual(backend.count('key90', 1), 2)
+        self.assertEqual(backend.count('key91', 1), 0)
+        self.assertEqual(backend.count('new', 1), 1)
+
+
+class LoginThrottleTestCase(TestCase):
+
+    def setUp(self):
+        self.timer = Timer()
+        self.throttle = LoginThrottle(limit=3, window=100, backoff=10,
+            max_backoff=25, timer=self.timer)
+
+    def tearDown(self):
+        pass
+
+    def test_throttle_login(self):
+        throttle = self.throttle
+        for i in range(2):
+            throttle.failure('user', '127.0.0.1')
+        self.assertEqual(throttle.check('user', '127.0.0.2'), 0)
+        throttle.failure('user', '127.0.0.2')
+        self.assertEqual(throttle.check('user', '127.0.0.3'), 10)
+        self.assertEqual(throttle.check('other', '127.0.0.3'), 0)
+        self.assertEqual(throttle.throttled, 1)
+
+        # backoff doubles, up to the maximum.
+        self.timer.now = 10
+        self.assertEqual(throttle.check('user', '127.0.0.3'), 0)
+        throttle.failure('user', '127.0.0.3')
+        self.assertEqual(throttle.check('user', '127.0.0.3'), 20)
+        self.timer.now = 30
+        throttle.failure('user', '127.0.0.3')
+        self.assertEqual(throttle.check('user', '127.0.0.3'), 25)
+
+        throttle.success('user', '127.0.0.3')
+        self.assertEqual(throttle.check('user', '127.0.0.3'), 0)
+
+    def test_throttle_address(self):
+        throttle = self.throttle
+        for login in ('a', 'b', 'c'):
+            throttle.failure(login, '127.0.0.1')
+        self.assertEqual(throttle.check('d', '127.0.0.1'), 10)
+        # success does not clear the address.
+        throttle.success('d', '127.0.0.1')
+        self.assertEqual(throttle.check('d', '127.0.0.1'), 10)
+        self.assertEqual(throttle.check('d', '127.0.0.2'), 0)
+
+    def test_backend_window(self):
+        self.assertEqual(self.throttle.window, 100)
+        self.assertEqual(LoginThrottle().window, 300)
+        backend = MemoryThrottleBackend(window=50)
+        self.assertEqual(LoginThrottle(backend=backend).window, 50)
+        self.assertRaises(ValueError, LoginThrottle, window=100,
+            backend=backend)
+
+    def test_throttled_threads(self):
+        throttle = self.throttle
+        for i in range(3):
+            throttle.failure('user', None)
+
+        def work():
+            for i in range(1000):
+                throttle.check('user', None)
+
+        threads = [threading.Thread(target=work) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(throttle.throttled, 4000)
+
+
+class ThrottleLoginTestCase(TestCase):
+
+    def setUp(self):
+        self.auth = SetupAcl('user', 'password')
+        self.timer = Timer()
+        self.throttle = LoginThrottle(limit=2, timer=self.timer)
+
+        app = Flask('mtj.flask.acl')
+        app.config['SECRET_KEY'] = 'test_secret_key'
+        app.config['MTJ_THROTTLE'] = self.throttle
+        self.auth(app, permission_denied_handler=None)
+        app.register_blueprint(user.acl_front, url_prefix='/acl')
+        app.config['TESTING'] = True
+        self.app = app
+
+    def tearDown(self):
+        pass
+
+    def test_login_throttled(self):
+        calls = []
+        validate = self.auth.validate
+        def counted(login, password):
+            calls.append(login)
+            return validate(login, password)
+        self.auth.validate = counted
+
+        with self.app.test_client() as c:
+            for i in range(2):
+                rv = c.post('/acl/login',
+                    data={'login': 'admin', 'password': 'wrong'})
+                self.assertTrue('Invalid credentials' in rv.data)
+
+            rv = c.post('/acl/login',
+                data={'login': 'admin', 'password': 'password'})
+            self.assertTrue('Too many failed attempts' in rv.data)
+            self.assertEqual(len(calls), 2)
+            self.assertEqual(self.throttle.throttled, 1)
+
+            self.timer.now = 60
+            rv = c.post('/acl/login',
+                data={'login': 'admin', 'password': 'password'})
+            self.assertEqual(rv.status_code, 302)
+
+
+def test_suite():
+    suite = TestSuite()
+    suite.addTest(makeSuite(MemoryThrottleBackendTestCase))
+    suite.addTest(makeSuite(LoginThrottleTestCase))
+    suite.addTest(makeSuite(ThrottleLoginTestCase))
+    return suite
+
+if __name__ == '__main__':
+    import unittest
+    unittest.main()
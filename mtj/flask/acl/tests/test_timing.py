@@ -0,0 +1,141 @@
+import logging
+from unittest import TestCase, TestSuite, makeSuite
+
+from flask import Flask, g
+
+from mtj.flask.acl import sql
+from mtj.flask.acl import user
+from mtj.flask.acl.timing import RequestTiming
+from mtj.flask.acl.timing import getRequestTiming
+from mtj.flask.acl.timing import timed
+
+
+class Handler(logging.Handler):
+
+    def __init__(self):
+        logging.Handler.__init__(self)
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+class RequestTimingTestCase(TestCase):
+
+    def setUp(self):
+        self.app = Flask('mtj.flask.acl')
+
+    def tearDown(self):
+        pass
+
+    def test_disabled(self):
+        self.assertTrue(getRequestTiming() is None)
+        with self.app.test_request_context('/'):
+            self.assertTrue(getRequestTiming() is None)
+
+    def test_timed(self):
+        @timed('outer')
+        def outer():
+            return inner() + 1
+
+        @timed('inner')
+        def inner():
+            return 1
+
+        self.assertEqual(outer(), 2)
+
+        self.app.config['MTJ_ACL_TIMING'] = True
+        with self.app.test_request_context('/'):
+            self.assertEqual(outer(), 2)
+            self.assertEqual(inner(), 1)
+            timing = g.mtj_acl_timing
+            self.assertEqual(timing.calls, {'outer': 1, 'inner': 2})
+            # the total only includes the outermost calls.
+            self.assertTrue(timing.time >= timing.times['outer'])
+            self.assertTrue(timing.time < sum(timing.times.values()))
+
+    def test_server_timing(self):
+        timing = RequestTiming()
+        timing.add('backend', 0.002)
+        timing.add('identity', 0.001, outermost=False)
+        timing.queries = 3
+        self.assertEqual(timing.serverTiming(),
+            'acl;dur=2.000;desc="2 calls", acl-backend;dur=2.000, '
+            'acl-identity;dur=1.000, acl-sql;desc="3 queries"')
+        self.assertEqual(timing.logLine(),
+            'acl_time=0.002000 queries=3 backend=1/0.002000 '
+            'identity=1/0.001000')
+
+
+class TimingIntegrationTestCase(TestCase):
+
+    def setUp(self):
+        self.auth = sql.SqlAcl(setup_login='admin', setup_password='password')
+
+        app = Flask('mtj.flask.acl')
+        self.auth(app, permission_denied_handler=None)
+        app.config['SECRET_KEY'] = 'test_secret_key'
+        app.config['TESTING'] = True
+        app.register_blueprint(user.acl_front, url_prefix='/acl')
+        self.app = app
+
+        self.handler = Handler()
+        self.logger = logging.getLogger('mtj.flask.acl.sqlacl')
+        self.logger.addHandler(self.handler)
+
+    def tearDown(self):
+        self.logger.removeHandler(self.handler)
+
+    def login(self, c):
+        c.post('/acl/login', data={'login': 'admin', 'password': 'password'})
+
+    def test_not_enabled(self):
+        with self.app.test_client() as c:
+            self.login(c)
+            rv = c.get('/acl/current')
+            self.assertFalse('Server-Timing' in rv.headers)
+            self.assertTrue(g.get('mtj_acl_timing') is None)
+
+    def test_timing(self):
+        self.app.config['MTJ_ACL_TIMING'] = True
+        with self.app.test_client() as c:
+            self.login(c)
+            rv = c.get('/acl/current')
+            self.assertFalse('Server-Timing' in rv.headers)
+            timing = g.mtj_acl_timing
+            self.assertEqual(timing.calls['identity'], 1)
+            self.assertEqual(timing.calls['tokens'], 1)
+            self.assertTrue(timing.calls['backend'] >= 1)
+            self.assertTrue(timing.queries >= 1)
+            self.assertTrue(timing.time > 0)
+        self.assertEqual(self.handler.records, [])
+
+    def test_server_timing_slow(self):
+        self.app.config['MTJ_ACL_TIMING'] = True
+        self.app.config['MTJ_ACL_SERVER_TIMING'] = True
+        self.app.config['MTJ_ACL_SLOW_THRESHOLD'] = 0
+        with self.app.test_client() as c:
+            self.login(c)
+            rv = c.get('/acl/list')
+            header = rv.headers['Server-Timing']
+            self.assertTrue(header.startswith('acl;dur='))
+            self.assertTrue('acl-identity;dur=' in header)
+            self.assertTrue('acl-sql;desc="' in header)
+
+        record = self.handler.records[-1]
+        self.assertEqual(record.levelno, logging.WARNING)
+        message = record.getMessage()
+        self.assertTrue(message.startswith(
+            'slow acl request method=GET path=/acl/list status=200 '))
+        self.assertTrue(record.mtj_acl_timing['queries'] >= 1)
+
+
+def test_suite():
+    suite = TestSuite()
+    suite.addTest(makeSuite(RequestTimingTestCase))
+    suite.addTest(makeSuite(TimingIntegrationTestCase))
+    return suite
+
+if __name__ == '__main__':
+    import unittest
+    unittest.main()
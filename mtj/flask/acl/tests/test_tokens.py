@@ -0,0 +1,177 @@
+from unittest import TestCase, TestSuite, makeSuite
+
+from flask import Flask
+
+from mtj.flask.acl.tokens import MemoryTokenStore
+from mtj.flask.acl.tokens import SignedTokenStore
+
+
+class Timer(object):
+
+    def __init__(self, now=0):
+        self.now = now
+
+    def __call__(self):
+        self.now += 1
+        return self.now
+
+
+class MemoryTokenStoreTestCase(TestCase):
+
+    def setUp(self):
+        self.timer = Timer()
+
+    def tearDown(self):
+        pass
+
+    def test_issue_validate(self):
+        store = MemoryTokenStore(timer=self.timer)
+        token = store.issue('user')
+        self.assertEqual(token['login'], 'user')
+        self.assertTrue(store.validate(token))
+        self.assertFalse(store.validate({'login': 'user', 'ts': 0}))
+        self.assertFalse(store.validate({'login': 'user', 'ts': []}))
+        self.assertFalse(store.validate({'login': 'other', 'ts': 0}))
+        self.assertFalse(store.validate({}))
+
+    def test_max_tokens(self):
+        store = MemoryTokenStore(max_tokens=2, timer=self.timer)
+        t1 = store.issue('user')
+        t2 = store.issue('user')
+        t3 = store.issue('user')
+        self.assertFalse(store.validate(t1))
+        self.assertTrue(store.validate(t2))
+        self.assertTrue(store.validate(t3))
+
+    def test_ttl(self):
+        store = MemoryTokenStore(ttl=10, timer=self.timer)
+        token = store.issue('user')
+        self.assertTrue(store.validate(token))
+        self.timer.now += 10
+        self.assertFalse(store.validate(token))
+        self.assertEqual(store.logins(), [])
+
+    def test_sweep(self):
+        store = MemoryTokenStore(ttl=10, sweep_interval=100,
+            timer=self.timer)
+        store.issue('user1')
+        store.issue('user2')
+        self.timer.now += 50
+        token = store.issue('user2')
+        self.assertEqual(sorted(store.logins()), ['user1', 'user2'])
+        self.timer.now += 50
+        # validation triggers the sweep of all expired tokens.
+        store.validate(token)
+        self.assertEqual(store.logins(), [])
+
+    def test_revoke(self):
+        store = MemoryTokenStore(timer=self.timer)
+        t1 = store.issue('user')
+        t2 = store.issue('user')
+        store.revoke(t1)
+        self.assertFalse(store.validate(t1))
+        self.assertTrue(store.validate(t2))
+        store.revokeAll('user')
+        self.assertFalse(store.validate(t2))
+
+
+class SignedTokenStoreTestCase(TestCase):
+
+    def setUp(self):
+        self.timer = Timer()
+        self.store = SignedTokenStore('secret', timer=self.timer)
+
+    def tearDown(self):
+        pass
+
+    def test_issue_validate(self):
+        token = self.store.issue('user')
+        self.assertEqual(token['login'], 'user')
+        self.assertTrue(self.store.validate(token))
+        # any node with the same secret can validate
+        other = SignedTokenStore('secret', timer=self.timer)
+        self.assertTrue(other.validate(token))
+        other = SignedTokenStore('terces', timer=self.timer)
+        self.assertFalse(other.validate(token))
+
+    def test_tampered(self):
+        token = self.store.issue('user')
+        self.assertFalse(self.store.validate(dict(token, login='admin')))
+        self.assertFalse(self.store.validate(dict(token, exp=None)))
+        self.assertFalse(self.store.validate(dict(token, sig=None)))
+        self.assertFalse(self.store.validate(dict(token, ts='')))
+        self.assertFalse(self.store.validate({'login': 'user', 'ts': 0}))
+        self.assertFalse(self.store.validate({}))
+
+    def test_unicode(self):
+        token = self.store.issue(u'\u3042')
+        self.assertTrue(self.store.validate(token))
+
+    def test_expiry(self):
+        store = SignedTokenStore('secret', ttl=10, timer=self.timer)
+        token = store.issue('user')
+        self.assertTrue(store.validate(token))
+        self.timer.now += 10
+        self.assertFalse(store.validate(token))
+
+    def test_revoke_all(self):
+        t1 = self.store.issue('user')
+        t2 = self.store.issue('admin')
+        self.store.revokeAll('user')
+        self.assertFalse(self.store.validate(t1))
+        self.assertTrue(self.store.validate(t2))
+        t3 = self.store.issue('user')
+        self.assertTrue(self.store.validate(t3))
+
+    def test_revoke(self):
+        t1 = self.store.issue('user')
+        t2 = self.store.issue('user')
+        t3 = self.store.issue('admin')
+        self.store.revoke(dict(t3, login='user'))
+        self.assertTrue(self.store.validate(t1))
+        self.store.revoke(t1)
+        self.assertFalse(self.store.validate(t1))
+        self.assertFalse(self.store.validate(t2))
+        self.assertTrue(self.store.validate(t3))
+
+    def test_app_secret(self):
+        store = SignedTokenStore(timer=self.timer)
+        self.assertRaises(ValueError, store.issue, 'user')
+
+        app1 = Flask('app1')
+        app1.config['SECRET_KEY'] = 'key'
+        app2 = Flask('app2')
+        app2.config['SECRET_KEY'] = u'key'
+        app3 = Flask('app3')
+        app3.config['SECRET_KEY'] = 'other'
+
+        with app1.app_context():
+            token = store.issue('user')
+        # i.e. another process of the same app.
+        other = SignedTokenStore(timer=self.timer)
+        with app2.app_context():
+            self.assertTrue(other.validate(token))
+        with app3.app_context():
+            self.assertFalse(other.validate(token))
+        self.assertFalse(other.validate(token))
+        # not signed with the key itself.
+        self.assertFalse(SignedTokenStore('key').validate(token))
+
+    def test_shared_generations(self):
+        generations = {}
+        store = SignedTokenStore('secret', generations, timer=self.timer)
+        other = SignedTokenStore('secret', generations, timer=self.timer)
+        token = store.issue('user')
+        other.revoke(token)
+        self.assertFalse(store.validate(token))
+
+
+def test_suite():
+    suite = TestSuite()
+    suite.addTest(makeSuite(MemoryTokenStoreTestCase))
+    suite.addTest(makeSuite(SignedTokenStoreTestCase))
+    return suite
+
+if __name__ == '__main__':
+    import unittest
+    unittest.main()
@@ -0,0 +1,129 @@
+from unittest import TestCase, TestSuite, makeSuite
+from StringIO import StringIO
+
+from mtj.flask.acl import flask
+from mtj.flask.acl import sql
+from mtj.flask.acl import transfer
+from mtj.flask.acl.cache import LRUCache
+
+
+class TransferTestCase(TestCase):
+
+    def setUp(self):
+        # usually registered by the permissions of the endpoints.
+        flask.register_role('admin')
+        self.src = sql.SqlAcl(setup_login='admin', setup_password='password')
+        self.src.registerMany([
+            ('user1', 'secret', 'User 1'),
+            ('user2', 'secret', None, 'user2@example.com'),
+        ])
+        self.src.addGroups([('user', 'Users')])
+        self.src.setUserGroupsMany({'user1': ['user'], 'user2': ['user']})
+        self.dst = sql.SqlAcl()
+
+    def tearDown(self):
+        pass
+
+    def test_export(self):
+        records = list(transfer.export_records(self.src, chunk_size=1))
+        self.assertEqual([r['type'] for r in records], [
+            'user', 'user', 'user', 'group', 'group',
+            'user_group', 'user_group', 'user_group', 'group_role'])
+        self.assertEqual(records[1]['login'], 'user1')
+        self.assertEqual(records[1]['name'], 'User 1')
+        self.assertEqual(records[1]['password_hash'],
+            self.src.getUser('user1').password)
+
+    def test_roundtrip(self):
+        stream = StringIO()
+        transfer.dump_jsonl(transfer.export_records(self.src), stream)
+        stream.seek(0)
+        importer = transfer.import_records(self.dst,
+            transfer.load_jsonl(stream), chunk_size=2, processes=0)
+        self.assertEqual(importer.counts, {
+            'user': 3, 'group': 2, 'user_group': 3, 'group_role': 1})
+        self.assertEqual(importer.skipped, 0)
+
+        # hashes are imported verbatim.
+        self.assertEqual(self.dst.getUser('user2').password,
+            self.src.getUser('user2').password)
+        self.assertEqual(self.dst.getUser('user2').email,
+            'user2@example.com')
+        self.assertTrue(self.dst.validate('admin', 'password'))
+        self.assertEqual(self.dst.getUserRoles(self.dst.getUser('admin')),
+            {'admin'})
+        self.assertEqual(len(self.dst.getUserGroups(
+            self.dst.getUser('user1'))), 1)
+
+        # importing again skips everything.
+        importer = transfer.import_records(self.dst,
+            transfer.export_records(self.src), processes=0)
+        self.assertEqual(sum(importer.counts.values()), 0)
+        self.assertEqual(importer.skipped, 9)
+
+    def test_plaintext(self):
+        importer = transfer.import_records(self.dst, [
+            {'type': 'user', 'login': 'user1', 'password': 'secret'},
+            {'type': 'user', 'login': 'user2', 'password': 'short'},
+            {'type': 'user', 'login': 'user3', 'password': 'password'},
+            {'type': 'unknown'},
+        ], processes=2)
+        self.assertEqual(importer.counts['user'], 2)
+        self.assertEqual(importer.skipped, 2)
+        self.assertTrue(self.dst.validate('user1', 'secret'))
+        self.assertTrue(self.dst.validate('user3', 'password'))
+        self.assertEqual(self.dst.getUser('user2'), None)
+
+    def test_no_pool_for_hashes(self):
+        importer = transfer.Importer(self.dst, processes=2)
+        for record in transfer.export_records(self.src):
+            importer.add(record)
+        importer.flush()
+        # only hashes were imported, so no processes were started.
+        self.assertEqual(importer._pool, None)
+        self.assertEqual(importer.counts['user'], 3)
+        importer.close()
+
+    def test_invalid_records(self):
+        importer = transfer.import_records(self.dst, [
+            {'type': 'user', 'login': 'user1',
+                'password_hash': self.src.getUser('user1').password},
+            {'type': 'user', 'login': 'user2', 'password_hash': 'plain'},
+            {'type': 'group', 'name': 'user'},
+            {'type': 'user_group', 'user': 'user1', 'group': 'user'},
+            {'type': 'user_group', 'user': 'user1', 'group': 'nogroup'},
+            {'type': 'user_group', 'user': 'user2', 'group': 'user'},
+            {'type': 'group_role', 'group': 'user', 'role': 'admin'},
+            {'type': 'group_role', 'group': 'user', 'role': 'norole'},
+            {'type': 'group_role', 'group': 'nogroup', 'role': 'admin'},
+        ], processes=0)
+        self.assertEqual(importer.counts, {
+            'user': 1, 'group': 1, 'user_group': 1, 'group_role': 1})
+        self.assertEqual(importer.skipped, 5)
+        self.assertEqual(self.dst.getUser('user2'), None)
+        self.assertEqual(self.dst.getGroupRoles(self.dst.getGroup('user')),
+            {'admin'})
+
+    def test_invalidates_cache(self):
+        dst = sql.SqlAcl(cache=LRUCache())
+        dst.register('user1', 'secret')
+        dst.addGroup('user')
+        user1 = dst.getUser('user1')
+        self.assertEqual(dst.getUserRoles(user1), set())
+
+        importer = transfer.Importer(dst, processes=0)
+        importer.add({'type': 'user_group', 'user': 'user1', 'group': 'user'})
+        importer.add({'type': 'group_role', 'group': 'user', 'role': 'admin'})
+        importer.flush()
+        self.assertEqual(dst.getUserRoles(user1), {'admin'})
+        importer.close()
+
+
+def test_suite():
+    suite = TestSuite()
+    suite.addTest(makeSuite(TransferTestCase))
+    return suite
+
+if __name__ == '__main__':
+    import unittest
+    unittest.main()
@@ -11,6 +11,8 @@ from mtj.flask.acl.base import anonymous
 
 from mtj.flask.acl import flask
 from mtj.flask.acl import user
+from mtj.flask.acl.principal import LazyNeeds
+from mtj.flask.acl.tokens import SignedTokenStore
 
 
 class UserTestCase(unittest.TestCase):
@@ -108,6 +110,8 @@ class UserTestCase(unittest.TestCase):
             ])
 
             rv = c.post('/acl/logout')
+            # token is revoked
+            self.assertEqual(self.auth.token_store.logins(), [])
             rv = c.get('/acl_items')
             self.assertEqual(rv.data.splitlines(), [
                 '<a href="/acl/login">log in</a>',
@@ -126,6 +130,17 @@ class UserTestCase(unittest.TestCase):
             self.assertFalse('<a href="add">' in rv.data)
             self.assertFalse('<a href="list">' in rv.data)
 
+    def test_user_logout_signed_token(self):
+        self.auth.token_store = SignedTokenStore('secret')
+        with self.app.test_client() as c:
+            rv = c.post('/acl/login',
+                data={'login': 'admin', 'password': 'password'})
+            token = session['mtj.access_token']
+            self.assertTrue(self.auth.validateAccessToken(token))
+            rv = c.post('/acl/logout')
+            # a copy of the token is no longer valid.
+            self.assertFalse(self.auth.validateAccessToken(token))
+
     def test_current_user_options(self):
         with self.app.test_client() as c:
             rv = c.post('/acl/login',
@@ -143,6 +158,47 @@ class UserTestCase(unittest.TestCase):
             self.assertFalse('<a href="add">' in rv.data)
             self.assertFalse('<a href="list">' in rv.data)
 
+    def test_request_role_cache(self):
+        calls = []
+        getUserRoles = self.auth.getUserRoles
+        def counted(user):
+            calls.append(user)
+            return getUserRoles(user)
+        self.auth.getUserRoles = counted
+
+        @self.app.route('/roles')
+        def roles():
+            flask.verifyUserRole('manager', 'reviewer', 'admin')
+            return ','.join(flask.getCurrentUserRoles())
+
+        with self.app.test_client() as c:
+            rv = c.post('/acl/login',
+                data={'login': 'admin', 'password': 'password'})
+            calls[:] = []
+            rv = c.get('/roles')
+            self.assertEqual(rv.data, 'admin')
+            self.assertEqual(len(calls), 1)
+
+    def test_lazy_roles(self):
+        calls = []
+        getUserRoles = self.auth.getUserRoles
+        def counted(user):
+            calls.append(user)
+            return getUserRoles(user)
+        self.auth.getUserRoles = counted
+
+        with self.app.test_client() as c:
+            rv = c.post('/acl/login',
+                data={'login': 'admin', 'password': 'password'})
+            calls[:] = []
+            rv = c.get('/acl_items')
+            self.assertTrue('<a href="/acl/logout">log out</a>' in rv.data)
+            self.assertEqual(len(calls), 0)
+
+            rv = c.get('/acl/list')
+            self.assertTrue('<td>admin</td>' in rv.data)
+            self.assertEqual(len(calls), 1)
+
     def test_edit_user(self):
         with self.app.test_client() as c:
             rv = c.post('/acl/login',
@@ -183,5 +239,26 @@ class UserTestCase(unittest.TestCase):
             self.assertTrue('Error updating password.' in rv.data)
 
 
+class LazyNeedsTestCase(unittest.TestCase):
+
+    def test_lazy_needs(self):
+        calls = []
+        def loader():
+            calls.append(1)
+            return ['a', 'b', 'c']
+
+        needs = LazyNeeds(loader, ['z'])
+        needs.add('d')
+        needs.discard('b')
+        self.assertFalse(needs.loaded)
+        self.assertEqual(calls, [])
+
+        self.assertTrue('a' in needs)
+        self.assertTrue(needs.loaded)
+        self.assertEqual(sorted(needs), ['a', 'c', 'd', 'z'])
+        self.assertEqual(set(['a', 'x']).intersection(needs), set(['a']))
+        self.assertEqual(len(calls), 1)
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,196 @@
+from __future__ import absolute_import
+
+import threading
+import time
+from array import array
+from collections import OrderedDict
+
+
+class BaseThrottleBackend(object):
+    """
+    Storage of the counters and blocks of a ``LoginThrottle``, which
+    may be implemented against some shared store such that the limits
+    apply across processes.
+    """
+
+    def hit(self, key, now):
+        """
+        Count a hit for key, returning the number of hits for the key
+        within the window.
+        """
+
+        raise NotImplementedError
+
+    def count(self, key, now):
+        raise NotImplementedError
+
+    def reset(self, key):
+        """
+        Remove the hits and block for key.
+        """
+
+        raise NotImplementedError
+
+    def getBlock(self, key):
+        """
+        Return a tuple of the time the key is blocked until and the
+        number of times it was blocked, or None.
+        """
+
+        raise NotImplementedError
+
+    def setBlock(self, key, until, strikes):
+        raise NotImplementedError
+
+
+class MemoryThrottleBackend(BaseThrottleBackend):
+    """
+    In memory backend, where the hits of each key are counted in a ring
+    buffer of buckets that together span the window.
+
+    At most ``max_keys`` keys and blocks are kept; beyond that the
+    least recently hit keys and least recently set blocks are evicted.
+    """
+
+    def __init__(self, window=300, buckets=10, max_keys=100000):
+        self.window = window
+        self.buckets = buckets
+        self.bucket_size = float(window) / buckets
+        self.max_keys = max_keys
+
+        # key -> [slot of last hit, array of counts], by last hit.
+        self._counts = OrderedDict()
+        # key -> (until, strikes), by time set.
+        self._blocks = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _advance(self, entry, slot):
+        last, counts = entry
+        elapsed = slot - last
+        if elapsed >= self.buckets:
+            for i in range(self.buckets):
+                counts[i] = 0
+        else:
+            for i in range(last + 1, slot + 1):
+                counts[i % self.buckets] = 0
+        entry[0] = slot
+
+    def hit(self, key, now):
+        slot = int(now / self.bucket_size)
+        with self._lock:
+            entry = self._counts.pop(key, None)
+            if entry is None:
+                self._evict(now)
+                entry = [slot, array('I', [0] * self.buckets)]
+            else:
+                self._advance(entry, slot)
+            # reinserted as the most recently hit.
+            self._counts[key] = entry
+            entry[1][slot % self.buckets] += 1
+            return sum(entry[1])
+
+    def count(self, key, now):
+        slot = int(now / self.bucket_size)
+        with self._lock:
+            entry = self._counts.get(key)
+            if entry is None:
+                return 0
+            self._advance(entry, slot)
+            return sum(entry[1])
+
+    def _evict(self, now):
+        # constant time per key, as the least recently hit keys are
+        # also the first to expire.
+        while self._counts and len(self._counts) >= self.max_keys:
+            key, entry = self._counts.popitem(last=False)
+            block = self._blocks.get(key)
+            if block is not None and block[0] <= now:
+                del self._blocks[key]
+
+    def reset(self, key):
+        with self._lock:
+            self._counts.pop(key, None)
+            self._blocks.pop(key, None)
+
+    def getBlock(self, key):
+        return self._blocks.get(key)
+
+    def setBlock(self, key, until, strikes):
+        with self._lock:
+            self._blocks.pop(key, None)
+            self._blocks[key] = (until, strikes)
+            while len(self._blocks) > self.max_keys:
+                self._blocks.popitem(last=False)
+
+
+class LoginThrottle(object):
+    """
+    Throttles login attempts by the login and by the client address.
+
+    Once a key gets ``limit`` failed attempts within the ``window``, it
+    is blocked for ``backoff`` seconds, doubling for every repeated
+    block up to ``max_backoff``.  The ``window`` (300 seconds by
+    default) is that of the backend, so it cannot be provided along
+    with a ``backend``, which must be set up with its own window.
+    """
+
+    def __init__(self, limit=10, window=None, backoff=60, max_backoff=3600,
+            backend=None, timer=time.time):
+        if backend is None:
+            backend = MemoryThrottleBackend(300 if window is None else window)
+        elif window is not None:
+            raise ValueError('window must be set on the backend')
+
+        self.limit = limit
+        self.window = getattr(backend, 'window', None)
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.backend = backend
+        self.timer = timer
+
+        self.throttled = 0
+        self._lock = threading.Lock()
+
+    def keys(self, login, address):
+        keys = []
+        if login:
+            keys.append(u'login:%s' % login)
+        if address:
+            keys.append(u'address:%s' % address)
+        return keys
+
+    def check(self, login, address):
+        """
+        Return the number of seconds until the next attempt is allowed
+        for the login or address, or 0 if it is allowed now.
+        """
+
+        now = self.timer()
+        remaining = 0
+        for key in self.keys(login, address):
+            block = self.backend.getBlock(key)
+            if block and block[0] > now:
+                remaining = max(remaining, block[0] - now)
+
+        if remaining:
+            with self._lock:
+                self.throttled += 1
+        return remaining
+
+    def failure(self, login, address):
+        now = self.timer()
+        for key in self.keys(login, address):
+            if self.backend.hit(key, now) < self.limit:
+                continue
+            block = self.backend.getBlock(key)
+            strikes = block[1] if block else 0
+            if block and block[0] > now:
+                continue
+            delay = min(self.backoff * 2 ** strikes, self.max_backoff)
+            self.backend.setBlock(key, now + delay, strikes + 1)
+
+    def success(self, login, address):
+        # only the login is cleared, as an address may be shared by
+        # both legitimate and malicious clients.
+        for key in self.keys(login, None):
+            self.backend.reset(key)
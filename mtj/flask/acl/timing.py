@@ -0,0 +1,136 @@
+from __future__ import absolute_import
+
+import functools
+import logging
+from timeit import default_timer
+
+from flask import current_app, g, request
+from flask import has_app_context
+
+# shared with the SqlAcl backend.
+logger = logging.getLogger('mtj.flask.acl.sqlacl')
+
+
+class RequestTiming(object):
+    """
+    Totals of the instrumented ACL calls made during a request.
+
+    ``calls`` and ``times`` are by category and include nested calls,
+    while ``time`` is the time spent in the outermost calls only, i.e.
+    the total time spent in the ACL.
+    """
+
+    def __init__(self):
+        self.calls = {}
+        self.times = {}
+        self.time = 0.0
+        self.queries = 0
+        self._depth = 0
+
+    def add(self, category, elapsed, outermost=True):
+        self.calls[category] = self.calls.get(category, 0) + 1
+        self.times[category] = self.times.get(category, 0.0) + elapsed
+        if outermost:
+            self.time += elapsed
+
+    def asDict(self):
+        return {
+            'time': self.time,
+            'queries': self.queries,
+            'calls': dict(self.calls),
+            'times': dict(self.times),
+        }
+
+    def serverTiming(self):
+        """
+        Return the value of a ``Server-Timing`` header for the totals,
+        with the durations in milliseconds.
+        """
+
+        metrics = ['acl;dur=%.3f;desc="%d calls"' % (
+            self.time * 1000, sum(self.calls.values()))]
+        for category in sorted(self.times):
+            metrics.append('acl-%s;dur=%.3f' % (
+                category, self.times[category] * 1000))
+        metrics.append('acl-sql;desc="%d queries"' % self.queries)
+        return ', '.join(metrics)
+
+    def logLine(self):
+        return ' '.join(['acl_time=%.6f' % self.time,
+            'queries=%d' % self.queries] + [
+            '%s=%d/%.6f' % (category, self.calls[category],
+                self.times[category]) for category in sorted(self.calls)])
+
+
+def getRequestTiming():
+    """
+    Return the timing of the current request, or None if timing is not
+    enabled by ``MTJ_ACL_TIMING`` or outside of an app context.
+    """
+
+    if not has_app_context():
+        return None
+    timing = g.get('mtj_acl_timing')
+    if timing is None and current_app.config.get('MTJ_ACL_TIMING'):
+        timing = g.mtj_acl_timing = RequestTiming()
+    return timing
+
+
+def timed(category):
+    """
+    Decorator to count and time the calls to the function under the
+    category in the timing of the current request.
+    """
+
+    def decorator(f):
+        @functools.wraps(f)
+        def wrapper(*a, **kw):
+            timing = getRequestTiming()
+            if timing is None:
+                return f(*a, **kw)
+
+            timing._depth += 1
+            start = default_timer()
+            try:
+                return f(*a, **kw)
+            finally:
+                timing._depth -= 1
+                timing.add(category, default_timer() - start,
+                    outermost=not timing._depth)
+        return wrapper
+    return decorator
+
+
+def count_query(*a, **kw):
+    """
+    SQLAlchemy ``before_cursor_execute`` listener to count the queries
+    of the current request.
+    """
+
+    timing = getRequestTiming()
+    if timing is not None:
+        timing.queries += 1
+
+
+def after_request(response):
+    """
+    Add the ``Server-Timing`` header if ``MTJ_ACL_SERVER_TIMING`` is
+    set, and log the totals if the time spent in the ACL exceeds the
+    ``MTJ_ACL_SLOW_THRESHOLD`` in seconds.
+    """
+
+    timing = g.get('mtj_acl_timing')
+    if timing is None:
+        return response
+
+    config = current_app.config
+    if config.get('MTJ_ACL_SERVER_TIMING'):
+        response.headers.add('Server-Timing', timing.serverTiming())
+
+    threshold = config.get('MTJ_ACL_SLOW_THRESHOLD')
+    if threshold is not None and timing.time > threshold:
+        logger.warning('slow acl request method=%s path=%s status=%d %s',
+            request.method, request.path, response.status_code,
+            timing.logLine(),
+            extra={'mtj_acl_timing': timing.asDict()})
+    return response
@@ -0,0 +1,252 @@
+from __future__ import absolute_import
+
+import hmac
+import threading
+import time
+from collections import OrderedDict
+from hashlib import sha256
+
+from flask import current_app
+from flask import has_app_context
+
+
+class BaseTokenStore(object):
+    """
+    Access token store interface.
+
+    Tokens are kept per login in the order they were issued, with at
+    most ``max_tokens`` live tokens per login; issuing beyond that
+    evicts the oldest one.  Tokens expire ``ttl`` seconds after being
+    issued (never, if ``ttl`` is None) and expired tokens are swept
+    every ``sweep_interval`` seconds as part of normal usage.
+    """
+
+    def __init__(self, ttl=None, max_tokens=16, sweep_interval=300,
+            timer=time.time):
+        self.ttl = ttl
+        self.max_tokens = max_tokens
+        self.sweep_interval = sweep_interval
+        self.timer = timer
+
+        self._next_sweep = timer() + sweep_interval
+
+    def _maybeSweep(self, now):
+        if self.ttl is not None and now >= self._next_sweep:
+            self._next_sweep = now + self.sweep_interval
+            self.sweep(now)
+
+    def issue(self, login):
+        """
+        Issue and return an access token for login.
+        """
+
+        raise NotImplementedError
+
+    def validate(self, access_token):
+        """
+        Return whether the access token is a live token.
+        """
+
+        raise NotImplementedError
+
+    def revoke(self, access_token):
+        raise NotImplementedError
+
+    def revokeAll(self, login):
+        raise NotImplementedError
+
+    def sweep(self, now=None):
+        """
+        Remove all expired tokens.
+        """
+
+        raise NotImplementedError
+
+    def logins(self):
+        """
+        Return the logins with tokens in the store, for stores that keep
+        track of the tokens issued.
+        """
+
+        raise NotImplementedError
+
+
+class MemoryTokenStore(BaseTokenStore):
+    """
+    In memory access token store, local to the process.
+    """
+
+    def __init__(self, *a, **kw):
+        super(MemoryTokenStore, self).__init__(*a, **kw)
+        # login -> OrderedDict of token id -> expiry time
+        self._tokens = {}
+        self._lock = threading.Lock()
+
+    def issue(self, login):
+        now = self.timer()
+        expires = None
+        if self.ttl is not None:
+            expires = now + self.ttl
+
+        with self._lock:
+            tokens = self._tokens.setdefault(login, OrderedDict())
+            tokens[now] = expires
+            while len(tokens) > self.max_tokens:
+                tokens.popitem(last=False)
+
+        self._maybeSweep(now)
+
+        return {
+            'login': login,
+            'ts': now,
+        }
+
+    def validate(self, access_token):
+        login = access_token.get('login')
+        ts = access_token.get('ts')
+        now = self.timer()
+        self._maybeSweep(now)
+
+        tokens = self._tokens.get(login)
+        if not tokens:
+            return False
+
+        try:
+            expires = tokens[ts]
+        except (KeyError, TypeError):
+            return False
+
+        if expires is not None and expires <= now:
+            self.revoke(access_token)
+            return False
+        return True
+
+    def revoke(self, access_token):
+        login = access_token.get('login')
+        ts = access_token.get('ts')
+        with self._lock:
+            tokens = self._tokens.get(login)
+            if not tokens:
+                return
+            try:
+                tokens.pop(ts, None)
+            except TypeError:
+                pass
+            if not tokens:
+                self._tokens.pop(login, None)
+
+    def revokeAll(self, login):
+        with self._lock:
+            self._tokens.pop(login, None)
+
+    def sweep(self, now=None):
+        if now is None:
+            now = self.timer()
+
+        with self._lock:
+            for login, tokens in list(self._tokens.items()):
+                expired = [ts for ts, expires in tokens.items()
+                    if expires is not None and expires <= now]
+                for ts in expired:
+                    del tokens[ts]
+                if not tokens:
+                    del self._tokens[login]
+
+    def logins(self):
+        return list(self._tokens.keys())
+
+
+class SignedTokenStore(BaseTokenStore):
+    """
+    Stateless access token store.
+
+    Tokens are signed with the secret and carry their own expiry, so
+    validation is a signature check with a single lookup of the
+    generation of the login.  Without a ``secret``, one is derived from
+    the ``SECRET_KEY`` of the current app, so that every process of the
+    app can validate the tokens of the others.  Revoking a token (i.e.
+    on logout) bumps the generation, which revokes all tokens of that
+    login, as individual tokens are not tracked.
+
+    The generations are kept in ``generations``, which defaults to a
+    dict local to the process such that revocations (including logging
+    out) are only seen by the process that made them.  With multiple
+    processes or nodes, a mapping shared between them (i.e. backed by a
+    database or cache server) must be provided, otherwise revoked tokens
+    remain valid everywhere else until they expire.
+    """
+
+    def __init__(self, secret=None, generations=None, *a, **kw):
+        kw.setdefault('ttl', 86400)
+        super(SignedTokenStore, self).__init__(*a, **kw)
+
+        self.secret = secret
+
+        if generations is None:
+            generations = {}
+        self.generations = generations
+
+    def getSecret(self):
+        """
+        Return the secret, or the one derived from the ``SECRET_KEY`` of
+        the current app; raises ValueError if there is neither.
+        """
+
+        if self.secret is not None:
+            return self.secret
+        key = has_app_context() and current_app.config.get('SECRET_KEY')
+        if not key:
+            raise ValueError('no secret and no SECRET_KEY for the app')
+        if isinstance(key, unicode):
+            key = key.encode('utf8')
+        # not the key itself, such that tokens do not sign anything else.
+        return hmac.new(key, 'mtj.flask.acl.tokens', sha256).hexdigest()
+
+    def _sign(self, login, ts, expires, generation):
+        msg = u'%s\0%r\0%r\0%d' % (login, ts, expires, generation)
+        return hmac.new(self.getSecret(), msg.encode('utf8'),
+            sha256).hexdigest()
+
+    def issue(self, login):
+        now = self.timer()
+        expires = None
+        if self.ttl is not None:
+            expires = now + self.ttl
+        generation = self.generations.get(login, 0)
+
+        return {
+            'login': login,
+            'ts': now,
+            'exp': expires,
+            'gen': generation,
+            'sig': self._sign(login, now, expires, generation),
+        }
+
+    def validate(self, access_token):
+        try:
+            login = access_token['login']
+            expires = access_token['exp']
+            generation = access_token['gen']
+            signature = access_token['sig']
+            expected = self._sign(
+                login, access_token['ts'], expires, generation)
+        except (KeyError, TypeError, ValueError):
+            return False
+
+        if not hmac.compare_digest(str(signature), expected):
+            return False
+        if expires is not None and expires <= self.timer():
+            return False
+        return generation == self.generations.get(login, 0)
+
+    def revoke(self, access_token):
+        # only for a valid token, such that a forged one cannot be used
+        # to log out any login.
+        if self.validate(access_token):
+            self.revokeAll(access_token['login'])
+
+    def revokeAll(self, login):
+        self.generations[login] = self.generations.get(login, 0) + 1
+
+    def sweep(self, now=None):
+        pass
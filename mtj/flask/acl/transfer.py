@@ -0,0 +1,281 @@
+from __future__ import absolute_import
+
+import json
+import multiprocessing
+
+from mtj.flask.acl import flask
+from mtj.flask.acl.sql import User, Group, UserGroup, GroupRole
+from mtj.flask.acl.sql import hash_password
+from mtj.flask.acl.sql import _chunked
+from mtj.flask.acl.sql import _transaction
+
+record_types = ('user', 'group', 'user_group', 'group_role')
+
+
+def _hash_password(args):
+    # for the process pool, hence a module level function.
+    try:
+        return hash_password(*args)
+    except AssertionError:
+        return None
+
+
+def export_records(acl, chunk_size=1000):
+    """
+    Generate all records from the acl, loading at most chunk_size rows
+    from the database at a time.
+
+    Each record is a dict with a ``type`` of ``user``, ``group``,
+    ``user_group`` or ``group_role``, with users exported with their
+    ``password_hash``.
+    """
+
+    session = acl.session()
+
+    q = session.query(User).order_by(User.login).yield_per(chunk_size)
+    for user in q:
+        yield {
+            'type': 'user',
+            'login': user.login,
+            'password_hash': user.password,
+            'name': user.name,
+            'email': user.email,
+        }
+
+    q = session.query(Group).order_by(Group.name).yield_per(chunk_size)
+    for group in q:
+        yield {
+            'type': 'group',
+            'name': group.name,
+            'description': group.description,
+        }
+
+    q = session.query(UserGroup.user, UserGroup.group).order_by(
+        UserGroup.id).yield_per(chunk_size)
+    for user, group in q:
+        yield {
+            'type': 'user_group',
+            'user': user,
+            'group': group,
+        }
+
+    q = session.query(GroupRole.group, GroupRole.role).order_by(
+        GroupRole.id).yield_per(chunk_size)
+    for group, role in q:
+        yield {
+            'type': 'group_role',
+            'group': group,
+            'role': role,
+        }
+
+    session.close()
+
+
+class Importer(object):
+    """
+    Imports records into the acl in chunks of chunk_size records.
+
+    Records that already exist are skipped, as are links to users or
+    groups that do not exist and roles that are not registered.  The
+    ``password_hash`` of users is imported verbatim if it is a hash of
+    one of the schemes of the hasher of the acl, while plaintext
+    passwords are hashed using a pool of processes (which defaults to
+    the number of cpus); set processes to 0 to hash them in this
+    process instead.
+    """
+
+    def __init__(self, acl, chunk_size=1000, processes=None):
+        self.acl = acl
+        self.chunk_size = chunk_size
+        self.processes = processes
+        self.counts = dict((t, 0) for t in record_types)
+        self.skipped = 0
+
+        self._pool = None
+        self._pending = dict((t, []) for t in record_types)
+        self._size = 0
+
+    def _hashPasswords(self, passwords):
+        if not passwords:
+            # no need to start the pool.
+            return []
+        args = [(password, self.acl.hasher) for password in passwords]
+        if not self.processes == 0:
+            if self._pool is None:
+                self._pool = multiprocessing.Pool(self.processes)
+            return self._pool.map(_hash_password, args)
+        return [_hash_password(a) for a in args]
+
+    def add(self, record):
+        record_type = record.get('type')
+        if record_type not in self._pending:
+            self.skipped += 1
+            return
+        self._pending[record_type].append(record)
+        self._size += 1
+        if self._size >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        # flushed in order such that groups exist before the links.
+        self._flushUsers(self._pending['user'])
+        self._flushGroups(self._pending['group'])
+        self._flushUserGroups(self._pending['user_group'])
+        self._flushGroupRoles(self._pending['group_role'])
+        for pending in self._pending.values():
+            del pending[:]
+        self._size = 0
+
+    def close(self):
+        self.flush()
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+        if self.acl.cache is not None:
+            self.acl.cache.clear()
+
+    def _flushUsers(self, records):
+        plain = [r for r in records if r.get('password_hash') is None]
+        hashes = self._hashPasswords([r.get('password') for r in plain])
+        for record, password_hash in zip(plain, hashes):
+            record['password_hash'] = password_hash
+
+        users = []
+        for record in records:
+            if not (record.get('login') and record.get('password_hash')):
+                self.skipped += 1
+                continue
+            if self.acl.hasher.identify(record['password_hash']) is None:
+                # unknown hash formats would never validate.
+                self.skipped += 1
+                continue
+            users.append({
+                'login': record['login'],
+                'password_hash': record['password_hash'],
+                'name': record.get('name'),
+                'email': record.get('email'),
+            })
+
+        registered = self.acl.registerMany(users)
+        self.counts['user'] += len(registered)
+        self.skipped += len(users) - len(registered)
+
+    def _flushGroups(self, records):
+        groups = [(r['name'], r.get('description'))
+            for r in records if r.get('name')]
+        added = self.acl.addGroups(groups)
+        self.counts['group'] += len(added)
+        self.skipped += len(records) - len(added)
+
+    def _valid(self, session, valid, names):
+        # either the column the names must exist in, or a set of names.
+        if isinstance(valid, (set, frozenset)):
+            return valid.intersection(names)
+        return self.acl._existing(session, valid, names)
+
+    def _flushLinks(self, records, cls, key, value, counter, keys, values):
+        """
+        Insert the links of the records that do not exist yet, where the
+        key and value are valid according to keys and values, returning
+        the links inserted.
+        """
+
+        links = set((r.get(key), r.get(value)) for r in records
+            if r.get(key) and r.get(value))
+        session = self.acl.session()
+        with _transaction(session):
+            valid_keys = self._valid(session, keys, set(k for k, v in links))
+            valid_values = self._valid(session, values,
+                set(v for k, v in links))
+            links = set((k, v) for k, v in links
+                if k in valid_keys and v in valid_values)
+
+            existing = set()
+            column = getattr(cls, key)
+            for chunk in _chunked(set(k for k, v in links)):
+                q = session.query(column, getattr(cls, value)).filter(
+                    column.in_(chunk))
+                existing.update(tuple(i) for i in q.all())
+            new_links = links - existing
+            session.bulk_insert_mappings(cls, [
+                {key: k, value: v} for k, v in new_links])
+        self.counts[counter] += len(new_links)
+        self.skipped += len(records) - len(new_links)
+        return new_links
+
+    def _flushUserGroups(self, records):
+        links = self._flushLinks(records, UserGroup, 'user', 'group',
+            'user_group', User.login, Group.name)
+        for login in set(k for k, v in links):
+            self.acl._invalidateUser(login, 'user_groups', 'user_roles',
+                'principal')
+
+    def _flushGroupRoles(self, records):
+        links = self._flushLinks(records, GroupRole, 'group', 'role',
+            'group_role', Group.name, flask._roles)
+        for group_name in set(k for k, v in links):
+            self.acl._invalidateGroup(group_name, roles=True)
+
+
+def import_records(acl, records, chunk_size=1000, processes=None):
+    """
+    Import the records into the acl, returning the importer with the
+    counts of the records imported.
+    """
+
+    importer = Importer(acl, chunk_size=chunk_size, processes=processes)
+    try:
+        for record in records:
+            importer.add(record)
+    finally:
+        importer.close()
+    return importer
+
+
+def dump_jsonl(records, stream):
+    for record in records:
+        stream.write(json.dumps(record, sort_keys=True))
+        stream.write('\n')
+
+
+def load_jsonl(stream):
+    for line in stream:
+        line = line.strip()
+        if line:
+            yield json.loads(line)
+
+
+def main(argv=None):
+    import argparse
+    import sys
+
+    from mtj.flask.acl.sql import SqlAcl
+
+    parser = argparse.ArgumentParser(
+        description='Import or export the ACL data of a database.')
+    parser.add_argument('action', choices=('import', 'export'))
+    parser.add_argument('src', help='SQLAlchemy database url')
+    parser.add_argument('path', nargs='?', default='-',
+        help='JSON lines file, defaults to stdin/stdout')
+    parser.add_argument('--chunk-size', type=int, default=1000)
+    parser.add_argument('--processes', type=int, default=None,
+        help='processes for hashing passwords, 0 to hash inline')
+    args = parser.parse_args(argv)
+
+    acl = SqlAcl(args.src)
+    if args.action == 'export':
+        stream = sys.stdout if args.path == '-' else open(args.path, 'w')
+        dump_jsonl(export_records(acl, args.chunk_size), stream)
+        stream.flush()
+        if stream is not sys.stdout:
+            stream.close()
+    else:
+        stream = sys.stdin if args.path == '-' else open(args.path)
+        importer = import_records(acl, load_jsonl(stream),
+            chunk_size=args.chunk_size, processes=args.processes)
+        result = dict(importer.counts, skipped=importer.skipped)
+        sys.stderr.write(json.dumps(result, sort_keys=True) + '\n')
+
+if __name__ == '__main__':
+    main()
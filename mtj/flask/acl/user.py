@@ -14,7 +14,17 @@ from mtj.flask.acl.flask import *
 
 
 def make_acl_front(name='acl_front', import_name='mtj.flask.acl.user',
-        layout='layout.html', template_folder='templates'):
+        layout='layout.html', template_folder='templates', metrics=None):
+    """
+    Make the blueprint for the ACL front end.
+
+    If ``metrics`` (an instance of ``mtj.flask.acl.metrics.Metrics``)
+    is provided, it is installed as ``MTJ_METRICS`` of the apps the
+    blueprint is registered with, along with ACL timing, and exported
+    at the ``/metrics`` route in the Prometheus text format to admins,
+    or to scrapers presenting the ``MTJ_METRICS_TOKEN`` of the app as a
+    bearer token.
+    """
 
     acl_front = Blueprint(name, import_name, template_folder=template_folder)
 
@@ -31,6 +41,9 @@ def make_acl_front(name='acl_front', import_name='mtj.flask.acl.user',
             return response
         return wrapper
 
+    # reject oversized submissions before any form is parsed.
+    acl_front.before_request(endpoint.check_form_size)
+
     # XXX the following can probably be replaced with a dictionary and
     # some sort of constructer.
 
@@ -74,6 +87,22 @@ def make_acl_front(name='acl_front', import_name='mtj.flask.acl.user',
     def passwd_admin(user_login):
         return endpoint.passwd_admin(user_login)
 
+    if metrics is not None:
+        @acl_front.record_once
+        def install_metrics(state):
+            state.app.config.setdefault('MTJ_METRICS', metrics)
+            state.app.config.setdefault('MTJ_ACL_TIMING', True)
+
+        acl_front.after_app_request(metrics.afterRequest)
+
+        @acl_front.route('/metrics')
+        def metrics_export():
+            endpoint.check_metrics_access()
+            response = make_response(metrics.render())
+            response.headers['Content-Type'] = (
+                'text/plain; version=0.0.4; charset=utf-8')
+            return response
+
     # Group Management
 
     @acl_front.route('/group/list')
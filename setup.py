@@ -27,6 +27,7 @@ setup(name='mtj.flask.acl',
           # -*- Extra requirements: -*-
           'passlib',
           'Flask-Principal',
+          'SQLAlchemy>=1.0',
       ],
       entry_points="""
       # -*- Entry points: -*-